@@ -1,3 +1,9 @@
 import sandboxmud.session
 import sandboxmud.entities
-import sandboxmud.util
\ No newline at end of file
+import sandboxmud.util
+import sandboxmud.async_server
+import sandboxmud.game_loop
+import sandboxmud.migrations
+import sandboxmud.indexes
+import sandboxmud.jobs
+import sandboxmud.archive
\ No newline at end of file
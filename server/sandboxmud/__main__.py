@@ -1,9 +1,10 @@
 """
-Run this file to start your server. It does all initial setup and contains the game loop.
+Run this file to start your server. It does all initial setup and starts the game loop.
 """
 import sandboxmud
 import mongoengine
 import telnetserver
+import asyncio
 import atexit
 
 
@@ -28,15 +29,17 @@ def clear_database():
     sandboxmud.entities.Room.drop_collection()
     sandboxmud.entities.CustomVerb.drop_collection()
     sandboxmud.entities.World.drop_collection()
+    sandboxmud.entities.WorldNumberCounter.drop_collection()
     sandboxmud.entities.WorldState.drop_collection()
     sandboxmud.entities.WorldSnapshot.drop_collection()
     sandboxmud.entities.Exit.drop_collection()
 
 if __name__ == "__main__":
     # Server setup starts here
-    import sys, getopt, time
+    import sys, getopt
 
     connected_to_db = False
+    use_polling_server = False
     
     # Sets up logger for main server logs
     logger = sandboxmud.util.setup_logger('server_logger', 'server.txt', console=True)
@@ -44,9 +47,9 @@ if __name__ == "__main__":
     # Process commmand line args
     command_line_args = sys.argv[1:]
     try:
-       opts, args = getopt.getopt(command_line_args,"d:")
+       opts, args = getopt.getopt(command_line_args,"d:p")
     except getopt.GetoptError:
-        print("Usage: python server.py [-d mongo_db_database_uri]\nIf you don't specify an URI, will try to connect to default docker-compose db.")
+        print("Usage: python server.py [-d mongo_db_database_uri] [-p]\nIf you don't specify an URI, will try to connect to default docker-compose db.\nUse -p to run the old telnetserver polling loop instead of the asyncio one.")
         sys.exit(2)
     
     # Try to connect to user-provided db
@@ -54,16 +57,27 @@ if __name__ == "__main__":
         if opt == "-d":
             database_connect(arg)
             connected_to_db = True
+        elif opt == "-p":
+            use_polling_server = True
     
     # If not connected yet, try to connect to the default db specified in the docker-compose file
     if not connected_to_db:
         database_connect()
+
+    # Bring the documents written by older versions up to date
+    sandboxmud.migrations.run_pending_migrations()
+
+    # Create the missing indexes and report how the most frequent queries are run
+    sandboxmud.indexes.check_indexes()
         
     # Server creation for telnet communication
-    server = telnetserver.TelnetServer(error_policy='ignore')
+    if use_polling_server:
+        server = telnetserver.TelnetServer(error_policy='ignore')
+    else:
+        server = sandboxmud.async_server.AsyncTelnetServer(error_policy='ignore')
 
-    # Dict of current session. Keys are ids provided by TelnetServer, values are the user's Session object.
-    sessions = {}
+    # The game loop keeps a Session for each connected client
+    game_loop = sandboxmud.game_loop.GameLoop(server)
 
     # Ensure there isn't any connected players at this point.
     client_ids_cleanup()
@@ -73,28 +87,7 @@ if __name__ == "__main__":
 
     logger.info("server started")
     # Start game loop
-    while True:
-        server.update()  # get new events
-
-        # Handle new connections
-        for new_client in server.get_new_clients():
-            sessions[new_client] = sandboxmud.session.Session(new_client, server)
-
-        # Handle disconnects
-        for disconnected_client in server.get_disconnected_clients():
-            if disconnected_client in sessions:
-                ended_session = sessions.pop(disconnected_client)
-                ended_session.disconnect()
-
-        # Let each session handle messages sent by his client
-        for sender_client, message in server.get_messages():
-            if sender_client in sessions:
-                session = sessions[sender_client]
-                if session.client_id is None:  # the session has disconnected by itself
-                    sessions.pop(sender_client)
-                else:
-                    session.process_message(message)
-
-        # Sleep a bit. We don't want to be using 100% CPU time.
-        time.sleep(0.2)
-
+    if use_polling_server:
+        game_loop.run_polling()
+    else:
+        asyncio.run(game_loop.run())
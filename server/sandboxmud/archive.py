@@ -0,0 +1,119 @@
+"""Reads and writes world archives: files with a whole world, to back it up or move it to another server.
+
+An archive holds the same representation of the world as the JSON of the exportar verb, split in records:
+    header      MAGIC and VERSION, packed with HEADER_FORMAT
+    records     each one is its kind (one byte) and the length of its payload, packed with RECORD_FORMAT,
+                followed by the payload, which is JSON compressed with zlib
+    end         a record of kind END, so a truncated archive is noticed
+
+The first record is a WORLD one, with the name of the world and the members of its representation that
+don't grow with it. Then there are ROOMS, EXITS, INVENTORY and SAVED_ITEMS records, with lists of at most
+RECORD_SIZE elements of other_rooms, exits, inventory and saved_items. The writer only keeps a record in
+memory at a time, as it reads the world. The reader joins all the records in a single dict, the same one
+the importer gets from the JSON of the importar verb, so the whole world is in memory while it's imported.
+"""
+import itertools
+import json
+import struct
+import types
+import zlib
+from . import verbs
+
+MAGIC = b'SMUDWRLD'
+VERSION = 1
+HEADER_FORMAT = '>8sH'
+RECORD_FORMAT = '>cI'
+RECORD_SIZE = 500  # elements of the lists of the world in each record
+COMPRESSION_LEVEL = 6
+
+WORLD = b'w'
+ROOMS = b'r'
+EXITS = b'e'
+INVENTORY = b'i'
+SAVED_ITEMS = b's'
+END = b'z'
+
+LIST_RECORDS = {ROOMS: 'other_rooms', EXITS: 'exits', INVENTORY: 'inventory', SAVED_ITEMS: 'saved_items'}
+
+
+class BadArchive(Exception):
+    """Raised when reading a file that isn't a world archive, or is truncated or corrupted"""
+
+
+def export_world(world, path):
+    """Writes world to a new archive at path. Returns the number of rooms written."""
+    world_dict = verbs.ExportWorld(None).stream_world_state(world.world_state)
+    rooms = 1
+    with open(path, 'wb') as archive:
+        archive.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION))
+        header = {key: value for key, value in world_dict.items() if not isinstance(value, types.GeneratorType)}
+        write_record(archive, WORLD, {'name': world.name, **header})
+        for kind, key in LIST_RECORDS.items():
+            elements = iter(world_dict[key])
+            while batch := list(itertools.islice(elements, RECORD_SIZE)):
+                write_record(archive, kind, batch)
+                if kind == ROOMS:
+                    rooms += len(batch)
+        write_record(archive, END, None)
+    return rooms
+
+
+def import_world(path, creator, name=None):
+    """Creates a new world from the archive at path, and returns it. creator gets the items that were in
+    inventories. If name isn't given, the world gets the name it had when it was archived.
+    Raises BadArchive if the file can't be read, and BadItem if some names of the world aren't valid."""
+    world_dict = read_archive(path)
+    importer = verbs.ImportWorld(None)
+    archived_name = world_dict.pop('name')
+    importer.prepare_new_world(creator, name or archived_name)
+    importer.populate_world_from_dict(world_dict)
+    return importer.new_world
+
+
+def read_archive(path):
+    """Returns the dict representation of the world in the archive at path, with its name."""
+    world_dict = None
+    with open(path, 'rb') as archive:
+        header = archive.read(struct.calcsize(HEADER_FORMAT))
+        if len(header) < struct.calcsize(HEADER_FORMAT) or struct.unpack(HEADER_FORMAT, header)[0] != MAGIC:
+            raise BadArchive('{} is not a world archive'.format(path))
+        version = struct.unpack(HEADER_FORMAT, header)[1]
+        if version > VERSION:
+            raise BadArchive('the archive is of version {}, and only versions up to {} can be read'.format(version, VERSION))
+
+        for kind, value in read_records(archive):
+            if kind == END:
+                break
+            if kind == WORLD:
+                world_dict = {**value, **{key: [] for key in LIST_RECORDS.values()}}
+            elif kind in LIST_RECORDS and world_dict is not None:
+                world_dict[LIST_RECORDS[kind]] += value
+            else:
+                raise BadArchive('unexpected record: {}'.format(kind))
+        else:
+            raise BadArchive('the archive is truncated')
+    if world_dict is None:
+        raise BadArchive('the archive has no world')
+    return world_dict
+
+
+def write_record(archive, kind, value):
+    payload = zlib.compress(json.dumps(value).encode('utf-8'), COMPRESSION_LEVEL)
+    archive.write(struct.pack(RECORD_FORMAT, kind, len(payload)))
+    archive.write(payload)
+
+
+def read_records(archive):
+    """Yields the (kind, value) of each record of archive, from its current position to its end."""
+    record_header_size = struct.calcsize(RECORD_FORMAT)
+    while header := archive.read(record_header_size):
+        if len(header) < record_header_size:
+            raise BadArchive('the archive is truncated')
+        kind, length = struct.unpack(RECORD_FORMAT, header)
+        payload = archive.read(length)
+        if len(payload) < length:
+            raise BadArchive('the archive is truncated')
+        try:
+            yield kind, json.loads(zlib.decompress(payload).decode('utf-8'))
+        except (zlib.error, ValueError) as error:
+            raise BadArchive('corrupted record: {}'.format(error))
@@ -0,0 +1,306 @@
+"""Telnet server built on asyncio.
+
+AsyncTelnetServer offers the same interface as telnetserver.TelnetServer (update, get_new_clients,
+get_disconnected_clients, get_messages, send_message and shutdown), so the game loop can drive any
+of them. The difference is that this one doesn't need to be polled: the game loop can await
+wait_for_events(), which returns as soon as a client connects, leaves or sends a line.
+
+It also protects itself from clients that read slower than the game writes to them. Once the
+socket buffer of a client goes over WRITE_HIGH_WATER bytes, its messages wait in a queue of at
+most max_pending_bytes. What happens to the messages that don't fit depends on overflow_policy.
+"""
+import asyncio
+import codecs
+import collections
+import logging
+
+
+class AsyncTelnetServer:
+    """A Telnet server that runs on the asyncio event loop.
+    Call start() from a coroutine to begin listening. Then, each time wait_for_events() returns,
+    call update() and read the events with get_new_clients, get_disconnected_clients and get_messages.
+    """
+
+    class _Client:
+        """Holds information about a connected client"""
+
+        def __init__(self, transport, address, decoder):
+            self.transport = transport  # asyncio transport used to send data to this client
+            self.address = address  # ip address of this client
+            self.decoder = decoder  # incremental decoder, keeps multibyte characters split between reads
+            self.text = ''  # decoded data sent by the client that doesn't form a full line yet
+            self.read_state = AsyncTelnetServer._READ_STATE_NORMAL
+            self.writing_paused = False  # True while the socket buffer is over the high-water mark
+            self.pending = collections.deque()  # encoded messages waiting for the socket buffer to drain
+            self.pending_bytes = 0
+            self.overflowing = False  # True since messages are lost until the queue is empty again
+
+    # Used to store different types of occurences
+    _EVENT_NEW_CLIENT = 1
+    _EVENT_CLIENT_LEFT = 2
+    _EVENT_MESSAGE = 3
+
+    # Different states we can be in while reading data from a client. See _strip_telnet_commands.
+    _READ_STATE_NORMAL = 1
+    _READ_STATE_COMMAND = 2
+    _READ_STATE_OPTION = 3
+    _READ_STATE_SUBNEG = 4
+    _READ_STATE_SUBNEG_COMMAND = 5
+
+    # Command codes used by Telnet protocol
+    _TN_INTERPRET_AS_COMMAND = 255
+    _TN_WILL = 251
+    _TN_WONT = 252
+    _TN_DO = 253
+    _TN_DONT = 254
+    _TN_SUBNEGOTIATION_START = 250
+    _TN_SUBNEGOTIATION_END = 240
+
+    # A client that sends this many characters without a line break gets them delivered as a message anyway.
+    MAX_LINE_LENGTH = 2**20
+
+    # What to do with the output of a client whose pending queue is full:
+    OVERFLOW_DROP = 'drop'  # messages that don't fit are discarded
+    OVERFLOW_TRUNCATE = 'truncate'  # the message that overflows is cut to fit, the following ones are discarded
+    OVERFLOW_DISCONNECT = 'disconnect'  # the client is disconnected
+
+    # Bytes of the socket buffer of a client over which we stop writing to it and start queueing.
+    WRITE_HIGH_WATER = 2**16
+
+    def __init__(self, encoding='utf-8', error_policy='replace', port=1234, max_pending_bytes=2**20, overflow_policy=OVERFLOW_TRUNCATE):
+        self.encoding = encoding
+        self.error_policy = error_policy
+        self.port = port
+        self.max_pending_bytes = max_pending_bytes  # cap of the pending queue of each client
+        self.overflow_policy = overflow_policy
+        # Slow consumer counters, see get_stats
+        self.dropped_messages = 0
+        self.truncated_messages = 0
+        self.overflow_disconnections = 0
+        self._listener = None
+        self._clients = {}  # maps client id to _Client object
+        self._next_id = 0
+        self._events = []  # occurences to be handled by the code, moved here from _new_events by update()
+        self._new_events = []
+        self._events_available = None  # asyncio.Event, created on start() so it belongs to the running loop
+
+    async def start(self):
+        """Starts listening for new clients. Must be awaited from the event loop that will run the server."""
+        self._events_available = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self._listener = await loop.create_server(lambda: _TelnetProtocol(self), '0.0.0.0', self.port)
+
+    async def wait_for_events(self):
+        """Returns when there is at least one event that update() will make available."""
+        await self._events_available.wait()
+
+    def update(self):
+        """Makes the events received since the last call available to 'get_new_clients',
+        'get_disconnected_clients' and 'get_messages'. The previous events are discarded.
+        """
+        self._events = self._new_events
+        self._new_events = []
+        self._events_available.clear()
+
+    def get_new_clients(self):
+        """Returns the ids of the clients that connected before the last call to 'update'."""
+        return [event[1] for event in self._events if event[0] == self._EVENT_NEW_CLIENT]
+
+    def get_disconnected_clients(self):
+        """Returns the ids of the clients that left before the last call to 'update'."""
+        return [event[1] for event in self._events if event[0] == self._EVENT_CLIENT_LEFT]
+
+    def get_messages(self):
+        """Returns (client id, message) tuples with the lines sent before the last call to 'update'."""
+        return [(event[1], event[2]) for event in self._events if event[0] == self._EVENT_MESSAGE]
+
+    def send_message(self, to, message):
+        """Sends message to the client with the id 'to'. Messages to unknown clients are ignored,
+        as telnetserver.TelnetServer does.
+        If the client isn't reading fast enough, the message is queued or handled by the overflow policy.
+        """
+        client = self._clients.get(to)
+        if client is None or client.transport.is_closing():
+            return
+        data = (message + "\n\r").encode(self.encoding, self.error_policy)
+        if not client.writing_paused:
+            client.transport.write(data)
+        elif client.pending_bytes + len(data) <= self.max_pending_bytes and not client.overflowing:
+            client.pending.append(data)
+            client.pending_bytes += len(data)
+        else:
+            self._handle_overflow(to, client, data)
+
+    def get_slow_consumers(self):
+        """Returns a dict with the number of queued bytes of each client that is reading slower than we write."""
+        return {client_id: client.pending_bytes for client_id, client in self._clients.items() if client.writing_paused}
+
+    def get_pending_bytes(self, client_id):
+        """Returns the bytes queued for a client because it reads slower than we write, or None if it isn't connected."""
+        client = self._clients.get(client_id)
+        if client is None or client.transport.is_closing():
+            return None
+        return client.pending_bytes
+
+    def get_stats(self):
+        """Returns the slow consumer counters: messages dropped and truncated, clients disconnected
+        because of overflow, and the clients that have output queued right now.
+        """
+        return {
+            'dropped_messages': self.dropped_messages,
+            'truncated_messages': self.truncated_messages,
+            'overflow_disconnections': self.overflow_disconnections,
+            'slow_consumers': len(self.get_slow_consumers()),
+        }
+
+    def shutdown(self):
+        """Disconnects all clients and stops listening for new ones."""
+        for client in self._clients.values():
+            client.transport.close()
+        if self._listener is not None:
+            self._listener.close()
+
+    def _add_event(self, event):
+        self._new_events.append(event)
+        self._events_available.set()
+
+    def _handle_overflow(self, client_id, client, data):
+        first_overflow = not client.overflowing
+        if first_overflow:
+            client.overflowing = True
+            logging.getLogger('server_logger').warning('client {} ({}) is not reading its output: {} bytes queued, policy {}'.format(
+                client_id, client.address, client.pending_bytes, self.overflow_policy))
+        if self.overflow_policy == self.OVERFLOW_DISCONNECT:
+            self.overflow_disconnections += 1
+            client.pending.clear()
+            client.pending_bytes = 0
+            client.transport.abort()  # close() would wait until the whole buffer has been sent
+        elif self.overflow_policy == self.OVERFLOW_TRUNCATE and first_overflow:
+            # keep what fits, without splitting a multibyte character, and end the line
+            room = self.max_pending_bytes - client.pending_bytes - 2
+            text = data[:max(room, 0)].decode(self.encoding, 'ignore')
+            data = (text + "\n\r").encode(self.encoding, self.error_policy)
+            client.pending.append(data)
+            client.pending_bytes += len(data)
+            self.truncated_messages += 1
+        else:
+            self.dropped_messages += 1
+
+    def _handle_pause_writing(self, client_id):
+        client = self._clients.get(client_id)
+        if client is not None:
+            client.writing_paused = True
+
+    def _handle_resume_writing(self, client_id):
+        client = self._clients.get(client_id)
+        if client is None:
+            return
+        client.writing_paused = False
+        # writing may pause the client again, then the rest waits for the next resume
+        while client.pending and not client.writing_paused:
+            data = client.pending.popleft()
+            client.pending_bytes -= len(data)
+            client.transport.write(data)
+        if not client.pending:
+            client.overflowing = False
+
+    def _handle_connect(self, transport):
+        client_id = self._next_id
+        self._next_id += 1
+        transport.set_write_buffer_limits(high=self.WRITE_HIGH_WATER)
+        peername = transport.get_extra_info('peername')
+        decoder = codecs.getincrementaldecoder(self.encoding)(self.error_policy)
+        self._clients[client_id] = self._Client(transport, peername[0] if peername else '', decoder)
+        self._add_event((self._EVENT_NEW_CLIENT, client_id))
+        return client_id
+
+    def _handle_disconnect(self, client_id):
+        if self._clients.pop(client_id, None) is not None:
+            self._add_event((self._EVENT_CLIENT_LEFT, client_id))
+
+    def _handle_data(self, client_id, data):
+        client = self._clients.get(client_id)
+        if client is None:
+            return
+        client.text += client.decoder.decode(self._strip_telnet_commands(client, data))
+        *lines, client.text = client.text.split('\n')
+        if len(client.text) >= self.MAX_LINE_LENGTH:
+            lines.append(client.text)
+            client.text = ''
+        for line in lines:
+            self._add_event((self._EVENT_MESSAGE, client_id, self._clean_line(line)))
+
+    def _strip_telnet_commands(self, client, data):
+        """The Telnet protocol allows special command codes to be inserted into the data. We don't need to
+        respond to any of them, but we must skip them so they are not interpreted as text. Returns the
+        bytes of data that are regular text.
+        """
+        if client.read_state == self._READ_STATE_NORMAL and self._TN_INTERPRET_AS_COMMAND not in data:
+            return data
+
+        text = bytearray()
+        for byte in data:
+            if client.read_state == self._READ_STATE_NORMAL:
+                if byte == self._TN_INTERPRET_AS_COMMAND:
+                    client.read_state = self._READ_STATE_COMMAND
+                else:
+                    text.append(byte)
+            elif client.read_state == self._READ_STATE_COMMAND:
+                if byte == self._TN_SUBNEGOTIATION_START:
+                    client.read_state = self._READ_STATE_SUBNEG
+                elif byte in (self._TN_WILL, self._TN_WONT, self._TN_DO, self._TN_DONT):
+                    client.read_state = self._READ_STATE_OPTION
+                elif byte == self._TN_INTERPRET_AS_COMMAND:  # escaped 255 byte
+                    text.append(byte)
+                    client.read_state = self._READ_STATE_NORMAL
+                else:
+                    client.read_state = self._READ_STATE_NORMAL
+            elif client.read_state == self._READ_STATE_OPTION:
+                client.read_state = self._READ_STATE_NORMAL
+            elif client.read_state == self._READ_STATE_SUBNEG:
+                if byte == self._TN_INTERPRET_AS_COMMAND:
+                    client.read_state = self._READ_STATE_SUBNEG_COMMAND
+            elif client.read_state == self._READ_STATE_SUBNEG_COMMAND:
+                if byte == self._TN_SUBNEGOTIATION_END:
+                    client.read_state = self._READ_STATE_NORMAL
+                else:
+                    client.read_state = self._READ_STATE_SUBNEG
+        return bytes(text)
+
+    def _clean_line(self, line):
+        # some telnet clients send the characters as soon as the user types them, so a backspace means
+        # that the previous character has been deleted.
+        if '\x08' in line:
+            characters = []
+            for character in line:
+                if character == '\x08':
+                    if characters:
+                        characters.pop()
+                else:
+                    characters.append(character)
+            line = ''.join(characters)
+        # telnet ends lines with CR LF or CR NUL. Remove them along with any spaces, tabs etc.
+        return line.replace('\x00', '').strip()
+
+
+class _TelnetProtocol(asyncio.Protocol):
+    """Forwards the asyncio events of a single connection to the AsyncTelnetServer."""
+
+    def __init__(self, server):
+        self.server = server
+        self.client_id = None
+
+    def connection_made(self, transport):
+        self.client_id = self.server._handle_connect(transport)
+
+    def data_received(self, data):
+        self.server._handle_data(self.client_id, data)
+
+    def pause_writing(self):
+        self.server._handle_pause_writing(self.client_id)
+
+    def resume_writing(self):
+        self.server._handle_resume_writing(self.client_id)
+
+    def connection_lost(self, exc):
+        self.server._handle_disconnect(self.client_id)
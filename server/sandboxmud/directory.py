@@ -0,0 +1,90 @@
+"""Defines the WorldDirectory class, an in-memory list of the worlds shown in the lobby.
+"""
+import time
+from . import entities
+
+
+class WorldEntry:
+    """What the lobby shows of a world."""
+
+    def __init__(self, world_id, number, name, creator_name, world_state_id):
+        self.world_id = world_id
+        self.number = number  # stable number of the world, used to enter it from the lobby
+        self.name = name
+        self.creator_name = creator_name
+        self.world_state_id = world_state_id
+
+
+class WorldDirectory:
+    """Process-wide list of the worlds, so the lobby can be shown, paged and searched without querying
+    the database each time.
+
+    It is loaded with a query of the fields shown in the lobby and another one for the names of the creators,
+    and loaded again the first time it's used after a world is created or deleted, or one of the LISTED_FIELDS
+    of a world changes (see World.change_listeners). Worlds created or deleted by other processes, like the archive
+    tool, are noticed by comparing the number of worlds and the highest number, at most every CHECK_INTERVAL seconds.
+    Worlds are listed by their number, which doesn't change, so each world keeps its place in the lobby.
+    """
+
+    PAGE_SIZE = 20
+    LISTED_FIELDS = {'number', 'name', 'creator', 'world_state'}
+    CHECK_INTERVAL = 5  # seconds between checks for worlds created or deleted by other processes
+
+    def __init__(self):
+        self._entries = None  # WorldEntry of each world, by number. None until it's loaded again.
+        self._entries_by_number = None
+        self._changes = 0  # times a world changed, so a load that overlaps a change isn't kept
+        self._version = None  # number of worlds and highest number when the entries were loaded
+        self._checked_at = 0
+
+    def world_changed(self, world=None, changed_fields=None):
+        """Called each time a World is saved or deleted, with the names of the fields that changed (None when
+        it is created or deleted). It may be called from job threads."""
+        if changed_fields is not None and not changed_fields & self.LISTED_FIELDS:
+            return
+        self._changes += 1
+        self._entries = None
+
+    def get_world(self, number):
+        """Returns the WorldEntry of the world with that number, or None."""
+        self._load()
+        return self._entries_by_number.get(number)
+
+    def search(self, text=None):
+        """Returns the WorldEntry of the worlds whose name or creator contains text, or of all the worlds."""
+        entries = self._load()
+        if not text:
+            return entries
+        text = text.casefold()
+        return [entry for entry in entries if text in entry.name.casefold() or text in entry.creator_name.casefold()]
+
+    def get_page(self, entries, page):
+        """Returns the entries of a page (counting from 0) of a list of entries, and the number of pages."""
+        page_count = max(1, -(-len(entries) // self.PAGE_SIZE))
+        return entries[page * self.PAGE_SIZE:(page + 1) * self.PAGE_SIZE], page_count
+
+    def _load(self):
+        entries = self._entries
+        if entries is not None and time.monotonic() - self._checked_at >= self.CHECK_INTERVAL:
+            self._checked_at = time.monotonic()
+            if self._get_version() != self._version:
+                entries = self._entries = None
+        if entries is not None:
+            return entries
+        changes = self._changes
+        version = self._get_version()
+        worlds = list(entities.World.objects(number__ne=None).only('number', 'name', 'creator', 'world_state').order_by('number').as_pymongo())
+        creator_names = {user['_id']: user['name'] for user in entities.User.objects(id__in=list({world['creator'] for world in worlds})).only('name').as_pymongo()}
+        entries = [WorldEntry(world['_id'], world['number'], world['name'], creator_names.get(world['creator'], ''), world['world_state'])
+                   for world in worlds]
+        self._entries_by_number = {entry.number: entry for entry in entries}
+        if changes == self._changes:
+            self._entries = entries
+            self._version = version
+            self._checked_at = time.monotonic()
+        return entries
+
+    def _get_version(self):
+        worlds = entities.World.objects(number__ne=None)
+        last_world = worlds.order_by('-number').only('number').as_pymongo().first()
+        return worlds.count(), None if last_world is None else last_world['number']
@@ -2,7 +2,10 @@ import mongoengine
 
 from .custom_verb import CustomVerb
 from .item import Item
+from .item_id_counter import ItemIdCounter
+from .preserved_document import PreservedDocument
 from .world import World
+from .world_number_counter import WorldNumberCounter
 from .world_state import WorldState
 from .world_snapshot import WorldSnapshot
 from .inventory import Inventory
@@ -18,6 +21,8 @@ from .exceptions import BadItem, EmptyName, WrongNameFormat, RoomNameClash, Taka
 # means:
 #   when a document of type Entity1 is deleted, delete_rule happens to all Entity2 that referenced that Entity1 on its field 'referencefield'
 # Note: rules are only applied to database, not runtime instances. They must be reloaded.
+# Note: worlds, snapshots, world states, rooms and items are deleted in bulk by deletion.WorldDeleter, which does what
+# their rules would do without running them.
 CustomVerb.register_delete_rule(Room, 'custom_verbs', mongoengine.PULL)
 CustomVerb.register_delete_rule(Item, 'custom_verbs', mongoengine.PULL)
 CustomVerb.register_delete_rule(WorldState, 'custom_verbs', mongoengine.PULL)
@@ -28,4 +33,6 @@ Room.register_delete_rule(Exit, 'room', mongoengine.CASCADE)
 Room.register_delete_rule(Exit, 'destination', mongoengine.CASCADE)
 WorldState.register_delete_rule(Room, 'world_state', mongoengine.CASCADE) 
 WorldState.register_delete_rule(Inventory, 'world_state', mongoengine.CASCADE)
-WorldSnapshot.register_delete_rule(World, 'snapshots', mongoengine.PULL)
\ No newline at end of file
+WorldState.register_delete_rule(ItemIdCounter, 'world_state', mongoengine.CASCADE)
+WorldSnapshot.register_delete_rule(World, 'snapshots', mongoengine.PULL)
+WorldSnapshot.register_delete_rule(PreservedDocument, 'snapshot', mongoengine.CASCADE)
\ No newline at end of file
@@ -0,0 +1,130 @@
+import bson
+from . import custom_verb as custom_verb_module
+from . import exit as exit_module
+from . import inventory as inventory_module
+from . import item as item_module
+from . import item_id_counter as item_id_counter_module
+from . import preserved_document as preserved_document_module
+from . import room as room_module
+from . import world_state as world_state_module
+
+class WorldStateCloner:
+    """Copies a whole world state with a few queries and one insert_many per collection.
+
+    The documents are read raw, the ids of the copies are generated beforehand and every reference
+    is remapped in memory, so nothing is validated or saved one document at a time. The copies are
+    equal to the originals, which were valid already.
+    """
+
+    def __init__(self, world_state):
+        self.world_state = world_state
+        self.new_ids = {}  # id of an original room, item or inventory -> id of its copy
+        self.new_documents = {}  # document class -> copies to insert
+
+    def clone(self):
+        """Returns the new WorldState."""
+        old_id = self.world_state.id
+        new_id = bson.ObjectId()
+        world_state = self._find(world_state_module.WorldState, id=old_id)[0]
+
+        rooms = self._find(room_module.Room, world_state=old_id)
+        saved_items = self._find(item_module.Item, saved_in=old_id)
+        inventories = self._find(inventory_module.Inventory, world_state=old_id)
+        carried_item_ids = {item_id for inventory in inventories for item_id in inventory.get('items', [])}
+        room_ids = {room['_id'] for room in rooms}
+        # the items of the world that are neither in a room nor carried are leftovers, and aren't copied
+        items = [item for item in self._find(item_module.Item, world_state=old_id)
+                 if item.get('room') in room_ids or item['_id'] in carried_item_ids]
+        exits = self._find(exit_module.Exit, world_state=old_id)
+
+        for document in rooms + items + saved_items + inventories:
+            self.new_ids[document['_id']] = bson.ObjectId()
+        custom_verbs = self._get_custom_verbs([world_state] + rooms + items + saved_items)
+
+        for room in rooms:
+            self._add_copy(room_module.Room, room, world_state=new_id, custom_verbs=self._clone_custom_verbs(room, custom_verbs))
+        for item in items:
+            room = {'room': self.new_ids[item['room']]} if item.get('room') in self.new_ids else {}
+            self._add_copy(item_module.Item, item, world_state=new_id, custom_verbs=self._clone_custom_verbs(item, custom_verbs), **room)
+        for item in saved_items:
+            self._add_copy(item_module.Item, item, saved_in=new_id, custom_verbs=self._clone_custom_verbs(item, custom_verbs))
+        for exit in exits:
+            if exit.get('room') in self.new_ids and exit.get('destination') in self.new_ids:
+                self._add_copy(exit_module.Exit, exit, _id=bson.ObjectId(), world_state=new_id,
+                               room=self.new_ids[exit['room']], destination=self.new_ids[exit['destination']])
+        for inventory in inventories:
+            self._add_copy(inventory_module.Inventory, inventory, world_state=new_id,
+                           items=[self.new_ids[item_id] for item_id in inventory.get('items', []) if item_id in self.new_ids])
+        for counter in self._find(item_id_counter_module.ItemIdCounter, world_state=old_id):
+            self._add_copy(item_id_counter_module.ItemIdCounter, counter, _id=bson.ObjectId(), world_state=new_id)
+
+        new_world_state = {**world_state, '_id': new_id, 'starting_room': self.new_ids[world_state['starting_room']],
+                           'custom_verbs': self._clone_custom_verbs(world_state, custom_verbs)}
+
+        for document_class, documents in self.new_documents.items():
+            document_class._get_collection().insert_many(documents, ordered=False)
+        # the world state is written last, so it's never there without its rooms
+        world_state_module.WorldState._get_collection().insert_one(new_world_state)
+        return world_state_module.WorldState.objects(id=new_id).get()
+
+    def _get_custom_verbs(self, documents):
+        """Returns a dict with the custom verbs referenced by documents, by id."""
+        custom_verb_ids = {custom_verb_id for document in documents for custom_verb_id in document.get('custom_verbs', [])}
+        if not custom_verb_ids:
+            return {}
+        return {custom_verb['_id']: custom_verb for custom_verb in self._find(custom_verb_module.CustomVerb, id__in=list(custom_verb_ids))}
+
+    def _find(self, document_class, **query):
+        """Returns the raw documents of document_class that match query."""
+        return list(document_class.objects(**query).as_pymongo())
+
+    def _clone_custom_verbs(self, document, custom_verbs):
+        """Adds a copy of each custom verb of document, and returns the list of their ids. Each reference gets its own copy."""
+        new_custom_verb_ids = []
+        for custom_verb_id in document.get('custom_verbs', []):
+            if custom_verb_id in custom_verbs:
+                new_custom_verb_ids.append(self._add_copy(custom_verb_module.CustomVerb, custom_verbs[custom_verb_id], _id=bson.ObjectId()))
+        return new_custom_verb_ids
+
+    def _add_copy(self, document_class, document, **changes):
+        """Adds a copy of the raw document with the given changes to the documents to insert. Returns its id."""
+        copy = {**document, '_id': self.new_ids.get(document['_id']), **changes}
+        self.new_documents.setdefault(document_class, []).append(copy)
+        return copy['_id']
+
+
+class SnapshotCloner(WorldStateCloner):
+    """Copies the world state a copy-on-write snapshot was taken of, as it was when the snapshot was taken.
+
+    The documents are read from the world state, except the ones written since then, whose versions
+    of that moment were kept as PreservedDocuments.
+    """
+
+    def __init__(self, snapshot):
+        super().__init__(snapshot.cow_base)
+        self.snapshot = snapshot
+        self.versions = {}  # collection -> versions kept for the snapshot, by document id
+
+    def _find(self, document_class, **query):
+        documents = {document['_id']: document for document in super()._find(document_class, **query)}
+        collection = document_class._get_collection_name()
+        if collection not in self.versions:
+            self.versions[collection] = preserved_document_module.PreservedDocument.get_versions(self.snapshot, collection)
+        for document_id, document in self.versions[collection].items():
+            documents.pop(document_id, None)
+            if document is not None and self._matches(document, query):
+                documents[document_id] = document
+        return list(documents.values())
+
+    @staticmethod
+    def _matches(document, query):
+        for field, value in query.items():
+            if field == 'id':
+                matches = document['_id'] == value
+            elif field == 'id__in':
+                matches = document['_id'] in value
+            else:
+                matches = document.get(field) == value
+            if not matches:
+                return False
+        return True
@@ -0,0 +1,71 @@
+from . import preserved_document as preserved_document_module
+
+class CopyOnWrite:
+    """Mixin of the documents that are part of a world state.
+
+    Copy-on-write snapshots share the documents of the world state they were taken from, so before one of
+    them is saved, modified or deleted, its current version is kept for those snapshots (see PreservedDocument).
+    When there are no such snapshots, the only cost is one query to check it.
+    """
+
+    # Fields of the raw document that reference its world state, in order of preference.
+    WORLD_STATE_FIELDS = ('world_state',)
+
+    @classmethod
+    def get_world_state_id(cls, document):
+        """Returns the id of the world state a raw document belongs to, or None."""
+        for field in cls.WORLD_STATE_FIELDS:
+            if document.get(field) is not None:
+                return document[field]
+        return None
+
+    def save(self, *args, **kwargs):
+        is_new = self.id is None
+        moved = not is_new and any(field in self._get_changed_fields() for field in self.WORLD_STATE_FIELDS)
+        if not is_new:
+            self._preserve(moved)
+        super().save(*args, **kwargs)
+        if is_new or moved:  # for the snapshots of its world state, it didn't exist
+            world_state_id = self.get_world_state_id(self.to_mongo())
+            preserved_document_module.PreservedDocument.preserve(self._get_collection_name(), [(world_state_id, self.id, None)])
+
+    def modify(self, query=None, **update):
+        self._preserve()
+        return super().modify(query, **update)
+
+    def update(self, **kwargs):
+        self._preserve()
+        return super().update(**kwargs)
+
+    def delete(self, *args, **kwargs):
+        self._preserve()
+        super().delete(*args, **kwargs)
+
+    def _preserve(self, moved=False):
+        # if the document is moving to another world state, the one in the database may have snapshots
+        world_state_ids = None if moved else [self.get_world_state_id(self.to_mongo())]
+        type(self).preserve_documents(world_state_ids, id=self.id)
+
+    @classmethod
+    def preserve_documents(cls, world_state_ids=None, moving_to=None, **query):
+        """Keeps the current version of the documents matching query, and of their custom verbs, before they are
+        written by something other than their own save, modify or delete, e.g. an update of a whole queryset.
+        If world_state_ids is given, nothing is read unless one of those world states has snapshots.
+        moving_to is the id of the world state the documents are being moved to, if any."""
+        if world_state_ids is not None and not preserved_document_module.PreservedDocument.get_snapshot_ids(world_state_ids):
+            return
+        documents = list(cls.objects(**query).as_pymongo())
+        versions = [(cls.get_world_state_id(document), document['_id'], document) for document in documents]
+        if moving_to is not None:
+            versions += [(moving_to, document['_id'], None) for document in documents]
+        preserved_document_module.PreservedDocument.preserve(cls._get_collection_name(), versions)
+
+        # custom verbs aren't changed once created, so they are kept along with the documents that have them
+        world_state_ids_by_verb = {custom_verb_id: cls.get_world_state_id(document)
+                                   for document in documents for custom_verb_id in document.get('custom_verbs', [])}
+        if world_state_ids_by_verb:
+            custom_verb_class = cls._fields['custom_verbs'].field.document_type
+            custom_verbs = custom_verb_class.objects(id__in=list(world_state_ids_by_verb)).as_pymongo()
+            preserved_document_module.PreservedDocument.preserve(
+                custom_verb_class._get_collection_name(),
+                [(world_state_ids_by_verb[custom_verb['_id']], custom_verb['_id'], custom_verb) for custom_verb in custom_verbs])
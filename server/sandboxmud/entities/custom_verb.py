@@ -1,4 +1,8 @@
 import mongoengine
+from . import item as item_module
+from . import room as room_module
+from . import world_snapshot as world_snapshot_module
+from . import world_state as world_state_module
 
 class CustomVerb(mongoengine.Document):
     names = mongoengine.ListField(mongoengine.StringField())
@@ -15,4 +19,11 @@ class CustomVerb(mongoengine.Document):
     def clone(self):
         new_custom_verb = CustomVerb(names=self.names.copy(), commands=self.commands.copy())
         new_custom_verb.save()
-        return new_custom_verb
\ No newline at end of file
+        return new_custom_verb
+
+    def delete(self):
+        # the documents it is pulled from may be shared with copy-on-write snapshots
+        if world_snapshot_module.WorldSnapshot.objects(cow_base__ne=None).only('id').first() is not None:
+            for document_class in [room_module.Room, item_module.Item, world_state_module.WorldState]:
+                document_class.preserve_documents(custom_verbs=self)
+        super().delete()
@@ -0,0 +1,110 @@
+import mongoengine
+from . import custom_verb as custom_verb_module
+from . import exit as exit_module
+from . import inventory as inventory_module
+from . import item as item_module
+from . import item_id_counter as item_id_counter_module
+from . import preserved_document as preserved_document_module
+from . import room as room_module
+from . import user as user_module
+from . import world as world_module
+from . import world_snapshot as world_snapshot_module
+from . import world_state as world_state_module
+
+class WorldDeleter:
+    """Deletes worlds, snapshots, world states, rooms and items along with everything that belongs to them,
+    with a few queries and one delete_many per collection.
+
+    The ids of all the documents to delete are collected first, reading only the references between them,
+    and then each collection is deleted at once. Neither the delete methods of the documents nor the delete
+    rules of mongoengine run: this class does what they would do.
+
+    Rooms and items of world states that have copy-on-write snapshots must be preserved by the caller (see
+    CopyOnWrite). The copy-on-write snapshots of the world states deleted as a whole are materialized, unless
+    they are deleted too.
+    """
+
+    def __init__(self, worlds=(), snapshots=(), world_states=(), rooms=(), items=()):
+        # documents or ids
+        self.world_ids = {getattr(world, 'id', world) for world in worlds}
+        self.snapshot_ids = {getattr(snapshot, 'id', snapshot) for snapshot in snapshots}
+        self.world_state_ids = {getattr(world_state, 'id', world_state) for world_state in world_states}
+        self.room_ids = {getattr(room, 'id', room) for room in rooms}
+        self.item_ids = {getattr(item, 'id', item) for item in items}
+        self.pulled_item_ids = set(self.item_ids)  # items deleted on their own, that may be in inventories that are kept
+        self.custom_verb_ids = set()
+        self.other_ids = {}  # document class -> ids of the documents to delete that don't reference anything else
+
+    def delete(self):
+        """Returns a dict with the number of documents deleted from each collection."""
+        self._collect_worlds()
+        self._collect_world_states()
+        self._collect_rooms_and_items()
+
+        # the ones that are being written to are deleted first
+        deleted = {}
+        for document_class, ids in [
+            (world_module.World, self.world_ids),
+            (world_snapshot_module.WorldSnapshot, self.snapshot_ids),
+            (world_state_module.WorldState, self.world_state_ids),
+            (room_module.Room, self.room_ids),
+            (item_module.Item, self.item_ids),
+            (custom_verb_module.CustomVerb, self.custom_verb_ids),
+        ] + list(self.other_ids.items()):
+            deleted[document_class._get_collection_name()] = self._delete_many(document_class, ids)
+        deleted[preserved_document_module.PreservedDocument._get_collection_name()] = (
+            preserved_document_module.PreservedDocument._get_collection().delete_many({'snapshot': {'$in': list(self.snapshot_ids)}}).deleted_count
+            if self.snapshot_ids else 0)
+
+        # what the delete rules of the documents would do with the ones that are kept
+        if self.snapshot_ids:
+            world_module.World.objects(snapshots__in=list(self.snapshot_ids)).update(pull_all__snapshots=list(self.snapshot_ids))
+        if self.pulled_item_ids:
+            inventory_module.Inventory.objects(items__in=list(self.pulled_item_ids)).update(pull_all__items=list(self.pulled_item_ids))
+        if self.room_ids:
+            user_module.User.objects(room__in=list(self.room_ids)).update(unset__room=True)
+        return deleted
+
+    def _collect_worlds(self):
+        for world in world_module.World.objects(id__in=list(self.world_ids)).only('world_state', 'snapshots').as_pymongo():
+            self.world_state_ids.add(world['world_state'])
+            self.snapshot_ids.update(world.get('snapshots', []))
+        for snapshot in world_snapshot_module.WorldSnapshot.objects(id__in=list(self.snapshot_ids)).only('snapshoted_state').as_pymongo():
+            if snapshot.get('snapshoted_state') is not None:
+                self.world_state_ids.add(snapshot['snapshoted_state'])
+
+    def _collect_world_states(self):
+        if not self.world_state_ids:
+            return
+        world_state_ids = list(self.world_state_ids)
+        # the copy-on-write snapshots that survive need their own copy of the world state from now on
+        for snapshot in world_snapshot_module.WorldSnapshot.objects(cow_base__in=world_state_ids, id__nin=list(self.snapshot_ids)):
+            snapshot.materialize()
+
+        for world_state in world_state_module.WorldState.objects(id__in=world_state_ids).only('custom_verbs').as_pymongo():
+            self.custom_verb_ids.update(world_state.get('custom_verbs', []))
+        self.room_ids.update(self._find_ids(room_module.Room, world_state__in=world_state_ids))
+        self.item_ids.update(self._find_ids(item_module.Item, mongoengine.Q(world_state__in=world_state_ids) | mongoengine.Q(saved_in__in=world_state_ids)))
+        for document_class in [exit_module.Exit, inventory_module.Inventory, item_id_counter_module.ItemIdCounter]:
+            self.other_ids.setdefault(document_class, set()).update(self._find_ids(document_class, world_state__in=world_state_ids))
+
+    def _collect_rooms_and_items(self):
+        if self.room_ids:
+            room_ids = list(self.room_ids)
+            self.item_ids.update(self._find_ids(item_module.Item, room__in=room_ids))
+            self.other_ids.setdefault(exit_module.Exit, set()).update(
+                self._find_ids(exit_module.Exit, mongoengine.Q(room__in=room_ids) | mongoengine.Q(destination__in=room_ids)))
+        for document_class, ids in [(room_module.Room, self.room_ids), (item_module.Item, self.item_ids)]:
+            for document in document_class.objects(id__in=list(ids), custom_verbs__ne=[]).only('custom_verbs').as_pymongo():
+                self.custom_verb_ids.update(document['custom_verbs'])
+
+    @staticmethod
+    def _find_ids(document_class, query=None, **kwargs):
+        documents = document_class.objects(query, **kwargs) if query is not None else document_class.objects(**kwargs)
+        return {document['_id'] for document in documents.only('id').as_pymongo()}
+
+    @staticmethod
+    def _delete_many(document_class, ids):
+        if not ids:
+            return 0
+        return document_class._get_collection().delete_many({'_id': {'$in': list(ids)}}).deleted_count
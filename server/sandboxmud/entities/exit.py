@@ -1,8 +1,8 @@
 import mongoengine
+from . import copy_on_write as copy_on_write_module
 from . import item as item_module
-from . import room as room_module
 
-class Exit(mongoengine.Document):
+class Exit(copy_on_write_module.CopyOnWrite, mongoengine.Document):
     name = mongoengine.StringField(required=True)
     destination = mongoengine.ReferenceField('Room', required=True)
     description = mongoengine.StringField(default='No tiene nada de especial.')
@@ -10,6 +10,11 @@ class Exit(mongoengine.Document):
     is_open = mongoengine.BooleanField(default=True)
     key_names = mongoengine.ListField(mongoengine.StringField())
     room = mongoengine.ReferenceField('Room', default=None)
+    world_state = mongoengine.ReferenceField('WorldState', default=None)  # world of its room, kept by save
+
+    meta = {
+        'indexes': [('room', 'name'), ('world_state', 'name'), 'destination']
+    }
 
     def __init__(self, *args, save_on_creation=True, **kwargs):
         super().__init__(*args, **kwargs)
@@ -17,9 +22,16 @@ class Exit(mongoengine.Document):
             self.save()
 
     def save(self):
-        self.ensure_i_am_valid()
+        if self.needs_name_validation():
+            self.ensure_i_am_valid()
+        if self.room is not None:
+            self.world_state = self.room._data.get('world_state')  # the raw reference, so the world state isn't loaded
         super().save()
 
+    def needs_name_validation(self):
+        """True if the exit is new or some field its name validation depends on has changed since it was loaded."""
+        return self.id is None or any(field in self._get_changed_fields() for field in item_module.Item.NAME_VALIDATION_FIELDS)
+
     def ensure_i_am_valid(self):
         name_conditions = self._get_name_validation_conditions(self.name,  self.room, self)
         for condition in name_conditions.values():
@@ -35,20 +47,16 @@ class Exit(mongoengine.Document):
         return item_module.Item.name_is_valid(exit_name, local_room, ignore_item)
     
     def add_key(self, item_name):
-        self.key_names.append(item_name)
-        self.save()
+        self.modify(push__key_names=item_name)
 
     def remove_key(self, item_name):
-        self.key_names.remove(item_name)
-        self.save()
+        self.modify(pull__key_names=item_name)
 
     def open(self):
-        self.is_open = True
-        self.save()
+        self.modify(set__is_open=True)
 
     def close(self):
-        self.is_open = False
-        self.save()
+        self.modify(set__is_open=False)
 
     def is_obvious(self):
         return self.visible == 'obvious'
@@ -65,7 +73,5 @@ class Exit(mongoengine.Document):
 
     @classmethod
     def get_exits_in_world_state(cls, world_state):
-        exits_in_world_state = []
-        for room in room_module.Room.objects(world_state=world_state):
-            exits_in_world_state += room.exits
-        return exits_in_world_state
\ No newline at end of file
+        """Returns the exits of the rooms of world_state."""
+        return list(Exit.objects(world_state=world_state))
\ No newline at end of file
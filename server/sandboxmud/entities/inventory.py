@@ -1,23 +1,36 @@
 import mongoengine
+from . import copy_on_write as copy_on_write_module
+from . import item as item_module
 
-class Inventory(mongoengine.Document):
+class Inventory(copy_on_write_module.CopyOnWrite, mongoengine.Document):
     user  = mongoengine.ReferenceField('User', required=True)
     world_state = mongoengine.ReferenceField('WorldState', required=True)
     items = mongoengine.ListField(mongoengine.ReferenceField('Item'))
 
+    meta = {
+        'indexes': [('user', 'world_state'), 'world_state']
+    }
+
     def __init__(self, *args, save_on_creation=True, **kwargs):
         super().__init__(*args, **kwargs)
         if self.id is None and save_on_creation:
                 self.save()
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # the items carried belong to the world state of the inventory
+        item_ids = [getattr(item, 'id', item) for item in self._data['items']]
+        if item_ids:
+            world_state_id = self.get_world_state_id(self.to_mongo())
+            item_module.Item.preserve_documents([world_state_id], moving_to=world_state_id, id__in=item_ids)
+            item_module.Item.objects(id__in=item_ids).update(set__world_state=self._data['world_state'])
+
     def add_item(self, item):
-        item.remove_from_room()
-        self.items.append(item)
-        self.save()
+        item.modify(unset__room=True, set__world_state=self._data['world_state'])
+        self.modify(push__items=item)
 
     def remove_item(self, item):
-        self.items.remove(item)
-        self.save()
+        self.modify(pull__items=item)
 
     def clone(self, new_world_state):
         new_inventory = Inventory(world_state=new_world_state, user=self.user)
@@ -1,11 +1,15 @@
 import mongoengine
+from . import copy_on_write as copy_on_write_module
+from . import deletion as deletion_module
 from .exceptions import *
 from . import exit as exit_module
 from . import inventory as inventory_module
+from . import item_id_counter as item_id_counter_module
 from . import room as room_module
+import collections
 import re
 
-class Item(mongoengine.Document):
+class Item(copy_on_write_module.CopyOnWrite, mongoengine.Document):
     item_id      = mongoengine.StringField(default=None)
     name         = mongoengine.StringField(required=True)
     description  = mongoengine.StringField(default='No tiene nada de especial.')
@@ -13,6 +17,11 @@ class Item(mongoengine.Document):
     custom_verbs = mongoengine.ListField(mongoengine.ReferenceField('CustomVerb'))
     room         = mongoengine.ReferenceField('Room', default=None)
     saved_in     = mongoengine.ReferenceField('WorldState', default=None)
+    world_state  = mongoengine.ReferenceField('WorldState', default=None)  # world of the room or inventory where the item is. None for saved items.
+
+    meta = {
+        'indexes': [('room', 'name'), ('world_state', 'name', 'visible'), ('saved_in', 'item_id')]
+    }
 
     def __init__(self, *args, save_on_creation=True, **kwargs):
         super().__init__(*args, **kwargs)
@@ -22,17 +31,24 @@ class Item(mongoengine.Document):
             if save_on_creation:
                 self.save()
 
+    WORLD_STATE_FIELDS = ('world_state', 'saved_in')
+
+    # Fields the name validation depends on. Saves that don't change any of them skip it.
+    NAME_VALIDATION_FIELDS = ('name', 'room', 'visible')
+
     def save(self):
-        self.ensure_i_am_valid()
+        if self.needs_name_validation():
+            self.ensure_i_am_valid()
+        if self.room is not None:
+            self.world_state = self.room._data.get('world_state')  # the raw reference, so the world state isn't loaded
         super().save()
 
+    def needs_name_validation(self):
+        """True if the item is new or some field its name validation depends on has changed since it was loaded."""
+        return self.id is None or any(field in self._get_changed_fields() for field in self.NAME_VALIDATION_FIELDS)
+
     def _generate_item_id(self):
-        id_number = 1
-        item_id = f"{self.name}#{id_number}"
-        while len(Item.objects(item_id=item_id, saved_in=self.saved_in)) > 0:
-            id_number = id_number + 1
-            item_id = f"{self.name}#{id_number}"
-        return item_id
+        return item_id_counter_module.ItemIdCounter.next_item_id(self._data['saved_in'], self.name)
 
     def ensure_i_am_valid(self):
         name_conditions = self._get_name_validation_conditions(self.name,  self.room, self, self.is_takable())
@@ -57,14 +73,25 @@ class Item(mongoengine.Document):
 
         conditions_for_this_item = {**conditions_for_this_item, **snapshot_conditions}
 
+        # The checks below are queries for documents with the same name, so they cost the same whatever the size of the world.
+        # ignore_item may be an Item or an Exit, ids are unique in both collections.
+        other_than_ignored = {} if ignore_item is None or ignore_item.id is None else {'id__ne': ignore_item.id}
+
         if local_room is not None:
+            in_room = {'room': local_room} if local_room.id is not None else None  # an unsaved room has nothing yet
+            # the raw reference, so the world state isn't loaded. Rooms that aren't in a world yet only check the room.
+            world_state = local_room._data.get('world_state')
+            in_world = {'world_state': world_state} if world_state is not None else None
             item_conditions = {
                 'unique_in_room': {
-                    'condition': item_name not in [item.name for item in local_room.items+local_room.exits if item != ignore_item],
+                    'condition': in_room is None or not (
+                            Item.objects(name=item_name, **in_room, **other_than_ignored).first()
+                            or exit_module.Exit.objects(name=item_name, **in_room, **other_than_ignored).first()
+                        ),
                     'exception': RoomNameClash()
                 },
                 'there_is_no_takable_with_same_name': {
-                    'condition': item_name not in [takable_item.name for takable_item in Item.get_items_in_world_state(local_room.world_state) if takable_item != ignore_item and takable_item.visible=='takable'],
+                    'condition': in_world is None or not Item.objects(name=item_name, visible='takable', **in_world, **other_than_ignored).first(),
                     'exception': TakableItemNameClash()
                 }
             }
@@ -73,9 +100,9 @@ class Item(mongoengine.Document):
         if local_room is not None and takable:
             takable_item_conditions = {
                 'name_is_globally_unique': {
-                    'condition': (
-                            item_name not in [item.name for item in Item.get_items_in_world_state(local_room.world_state) if item != ignore_item]
-                            and item_name not in [item.name for item in exit_module.Exit.get_exits_in_world_state(local_room.world_state) if item != ignore_item]
+                    'condition': in_world is None or not (
+                            Item.objects(name=item_name, **in_world, **other_than_ignored).first()
+                            or exit_module.Exit.objects(name=item_name, **in_world, **other_than_ignored).first()
                         ),
                     'exception': NameNotGloballyUnique()
                 }
@@ -84,6 +111,37 @@ class Item(mongoengine.Document):
 
         return conditions_for_this_item
 
+    @classmethod
+    def ensure_names_are_valid(cls, items, exits):
+        """Checks the names of all the items and exits of a world in a single pass, without queries, applying the
+        same rules as ensure_i_am_valid. Meant for worlds that aren't in the database yet, e.g. one being imported."""
+        documents = list(items) + list(exits)
+        names_in_rooms = collections.Counter()  # (room id, name) -> items and exits with that name in the room
+        names_in_world = collections.Counter()  # name -> items and exits with that name in the world
+        takable_names = collections.Counter()   # name -> takable items with that name in the world
+        for document in documents:
+            if document.room is not None:
+                names_in_rooms[(document.room.id, document.name)] += 1
+            if document.world_state is not None:
+                names_in_world[document.name] += 1
+                if isinstance(document, Item) and document.is_takable():
+                    takable_names[document.name] += 1
+
+        for document in documents:
+            takable = isinstance(document, Item) and document.is_takable()
+            if len(document.name) == 0:
+                raise EmptyName()
+            if re.search("#\d+$", document.name):
+                raise WrongNameFormat()
+            if document.room is None:
+                continue
+            if names_in_rooms[(document.room.id, document.name)] > 1:
+                raise RoomNameClash()
+            if takable_names[document.name] > (1 if takable else 0):
+                raise TakableItemNameClash()
+            if takable and names_in_world[document.name] > 1:
+                raise NameNotGloballyUnique()
+
     @classmethod
     def name_is_valid(cls, item_name, local_room, ignore_item=None, takable=False):
         conditions = cls._get_name_validation_conditions(item_name, local_room, ignore_item, takable)
@@ -105,8 +163,7 @@ class Item(mongoengine.Document):
         return self.visible == 'takable'
 
     def add_custom_verb(self, custom_verb):
-        self.custom_verbs.append(custom_verb)
-        self.save()
+        self.modify(push__custom_verbs=custom_verb)
 
     def clone(self, new_room=None, new_saved_in=None, new_item_id=None):
         new_item = Item(name=self.name, description=self.description, visible=self.visible, room=new_room, saved_in=new_saved_in, item_id=new_item_id)
@@ -117,25 +174,20 @@ class Item(mongoengine.Document):
 
     @classmethod
     def get_items_in_world_state(cls, world_state):
-        items_at_rooms = []
-        for room in room_module.Room.objects(world_state=world_state):
-            items_at_rooms += room.items
-
-        items_being_carried = []
-        for inventory in inventory_module.Inventory.objects(world_state=world_state):
-            items_being_carried += inventory.items
-
-        return items_at_rooms + items_being_carried
+        """Returns the items in the rooms and inventories of world_state."""
+        return list(Item.objects(world_state=world_state))
 
     def put_in_room(self, room):
         self.room = room
         self.save()
 
     def remove_from_room(self):
-        self.room = None
-        self.save()
+        # An item without room has nothing to validate. It stays in its world state, as it's
+        # either being carried or about to be placed somewhere else.
+        self.modify(unset__room=True)
 
     def delete(self):
-        for custom_verb in self.custom_verbs:
-            custom_verb.delete()
-        super().delete()
\ No newline at end of file
+        # the inventories it is pulled from
+        inventory_module.Inventory.preserve_documents([self.get_world_state_id(self.to_mongo())], items=self)
+        self._preserve()
+        deletion_module.WorldDeleter(items=[self]).delete()
\ No newline at end of file
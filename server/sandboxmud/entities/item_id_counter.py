@@ -0,0 +1,41 @@
+import re
+import mongoengine
+import pymongo
+from . import item as item_module
+
+class ItemIdCounter(mongoengine.Document):
+    """Last number used in the item_id of the saved items of a world state with a given name, e.g. 3 after 'llave#3'."""
+    world_state = mongoengine.ReferenceField('WorldState', required=True)
+    name        = mongoengine.StringField(required=True)
+    last_number = mongoengine.IntField(default=0)
+
+    meta = {
+        'indexes': [{'fields': ('world_state', 'name'), 'unique': True}]
+    }
+
+    @classmethod
+    def next_item_id(cls, world_state, name):
+        """Returns a new item_id for a saved item of world_state called name. The number is allocated with
+        an atomic $inc, so two items saved at the same time never get the same id."""
+        world_state_id = getattr(world_state, 'id', world_state)
+        collection = cls._get_collection()
+        while True:
+            counter = collection.find_one_and_update(
+                {'world_state': world_state_id, 'name': name}, {'$inc': {'last_number': 1}},
+                return_document=pymongo.ReturnDocument.AFTER)
+            if counter is not None:
+                return f"{name}#{counter['last_number']}"
+            # first id of this name: the counter is created with the last number used by the saved items made
+            # before the counters existed, and the number is then allocated with $inc like any other
+            try:
+                collection.update_one(
+                    {'world_state': world_state_id, 'name': name},
+                    {'$max': {'last_number': cls._get_last_legacy_number(world_state_id, name)}}, upsert=True)
+            except pymongo.errors.DuplicateKeyError:  # somebody else created the counter first
+                pass
+
+    @classmethod
+    def _get_last_legacy_number(cls, world_state_id, name):
+        item_id_format = re.compile('^{}#(\\d+)$'.format(re.escape(name)))
+        saved_items = item_module.Item.objects(saved_in=world_state_id, item_id=item_id_format).only('item_id').as_pymongo()
+        return max((int(item_id_format.match(item['item_id']).group(1)) for item in saved_items), default=0)
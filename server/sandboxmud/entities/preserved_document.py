@@ -0,0 +1,54 @@
+import mongoengine
+import pymongo
+
+class PreservedDocument(mongoengine.Document):
+    """Version of a document of a world state as it was when a copy-on-write snapshot of it was taken.
+
+    A snapshot that is still sharing the documents of its world state (see WorldSnapshot.cow_base) only needs
+    the versions of the documents written after it was taken. Before the first write to one of them, its
+    version is kept here. document is None for the documents that didn't exist in the world state yet.
+    """
+    snapshot      = mongoengine.ReferenceField('WorldSnapshot', required=True)
+    collection    = mongoengine.StringField(required=True)
+    document_id   = mongoengine.ObjectIdField(required=True)
+    document      = mongoengine.DictField(default=None)
+
+    meta = {
+        'indexes': [{'fields': ('snapshot', 'collection', 'document_id'), 'unique': True}]
+    }
+
+    @classmethod
+    def get_snapshot_ids(cls, world_state_ids):
+        """Returns a dict with the ids of the copy-on-write snapshots of each of the given world states that have any."""
+        world_state_ids = [world_state_id for world_state_id in world_state_ids if world_state_id is not None]
+        if not world_state_ids:
+            return {}
+        snapshot_ids = {}
+        world_snapshot_class = cls._fields['snapshot'].document_type  # not imported, the entities with copy-on-write import this module
+        for snapshot in world_snapshot_class.objects(cow_base__in=world_state_ids).only('id', 'cow_base').as_pymongo():
+            snapshot_ids.setdefault(snapshot['cow_base'], []).append(snapshot['_id'])
+        return snapshot_ids
+
+    @classmethod
+    def preserve(cls, collection, versions):
+        """Keeps the given versions of documents of collection for the snapshots of their world states that don't have one yet.
+        versions is a list of (world state id, document id, raw document or None) tuples."""
+        snapshot_ids = cls.get_snapshot_ids({world_state_id for world_state_id, _, _ in versions})
+        records = {}
+        for world_state_id, document_id, document in versions:
+            for snapshot_id in snapshot_ids.get(world_state_id, []):
+                # only the first version after the snapshot counts
+                records.setdefault((snapshot_id, document_id), {'snapshot': snapshot_id, 'collection': collection, 'document_id': document_id, 'document': document})
+        if records:
+            try:
+                cls._get_collection().insert_many(list(records.values()), ordered=False)
+            except pymongo.errors.BulkWriteError as error:
+                # the documents that already had a version kept are rejected by the unique index
+                if any(write_error['code'] != 11000 for write_error in error.details['writeErrors']):
+                    raise
+
+    @classmethod
+    def get_versions(cls, snapshot, collection):
+        """Returns a dict with the versions kept for snapshot of the documents of collection, by document id."""
+        preserved = cls.objects(snapshot=snapshot, collection=collection).only('document_id', 'document').as_pymongo()
+        return {version['document_id']: version.get('document') for version in preserved}
@@ -1,15 +1,21 @@
 import mongoengine
+from . import copy_on_write as copy_on_write_module
+from . import deletion as deletion_module
 from . import exit as exit_module
 from . import item as item_module
 from . import user as user_module
 
-class Room(mongoengine.Document):
+class Room(copy_on_write_module.CopyOnWrite, mongoengine.Document):
     name        = mongoengine.StringField(required=True)
     world_state = mongoengine.ReferenceField('WorldState')
     alias       = mongoengine.StringField(required=True)  # id of the room, unique in each world state
     description = mongoengine.StringField(default='')
     custom_verbs = mongoengine.ListField(mongoengine.ReferenceField('CustomVerb'))
 
+    meta = {
+        'indexes': [('world_state', 'alias')]
+    }
+
     def __init__(self, *args, save_on_creation=True, **kwargs):
         if 'alias' in kwargs:
             super().__init__(*args, **kwargs)
@@ -19,9 +25,18 @@ class Room(mongoengine.Document):
         if self.id is None and save_on_creation:
             self.save()
 
+    def save(self, *args, **kwargs):
+        world_state_changed = self.id is not None and 'world_state' in self._get_changed_fields()
+        super().save(*args, **kwargs)
+        if world_state_changed:  # the items and exits in the room belong to its world state
+            new_world_state_id = self.get_world_state_id(self.to_mongo())
+            item_module.Item.preserve_documents(moving_to=new_world_state_id, room=self)
+            exit_module.Exit.preserve_documents(moving_to=new_world_state_id, room=self)
+            item_module.Item.objects(room=self).update(set__world_state=self._data['world_state'])
+            exit_module.Exit.objects(room=self).update(set__world_state=self._data['world_state'])
+
     def add_custom_verb(self, custom_verb):
-        self.custom_verbs.append(custom_verb)
-        self.save()
+        self.modify(push__custom_verbs=custom_verb)
 
     def get_exit(self, exit_name=None, destination=None):
         if exit_name is not None and destination is not None:
@@ -62,6 +77,10 @@ class Room(mongoengine.Document):
         return new_room
 
     def delete(self):
-        for custom_verb in self.custom_verbs:
-            custom_verb.delete()
-        super().delete()
\ No newline at end of file
+        # the items and exits deleted along with the room
+        world_state_ids = [self.get_world_state_id(self.to_mongo())]
+        item_module.Item.preserve_documents(world_state_ids, room=self)
+        exit_module.Exit.preserve_documents(world_state_ids, room=self)
+        exit_module.Exit.preserve_documents(world_state_ids, destination=self)
+        self._preserve()
+        deletion_module.WorldDeleter(rooms=[self]).delete()
\ No newline at end of file
@@ -7,11 +7,24 @@ class User(mongoengine.Document):
     client_id = mongoengine.IntField(default=None)
     master_mode = mongoengine.BooleanField(default=False)
 
+    meta = {
+        'indexes': [{'fields': ['name'], 'unique': True}, ('room', 'client_id')]
+    }
+
+    # Functions called with the user each time one is saved. They keep in-memory state, like
+    # the session registry, in sync with the database.
+    save_listeners = []
+
     def __init__(self, *args, save_on_creation=True,  **kwargs):
         super().__init__(*args, **kwargs)
         if self.id is None and save_on_creation:
             self.save()
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        for listener in self.save_listeners:
+            listener(self)
+
     def move(self, exit_name):
         if exit_name in [exit.name for exit in self.room.exits]:
             self.room = self.room.get_exit(exit_name).destination
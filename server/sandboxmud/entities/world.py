@@ -1,6 +1,7 @@
 import mongoengine
 from .exceptions import *
-from . import user as user_module
+from . import deletion as deletion_module
+from . import world_number_counter as world_number_counter_module
 from . import world_state as world_state_module
 
 class World(mongoengine.Document):
@@ -10,6 +11,16 @@ class World(mongoengine.Document):
     all_can_edit = mongoengine.BooleanField(default=False)
     editors = mongoengine.ListField(mongoengine.ReferenceField('User'))
     creator = mongoengine.ReferenceField('User', required=True)
+    number = mongoengine.IntField(default=None)  # stable number of the world in the lobby, given when it is first saved
+
+    meta = {
+        'indexes': ['world_state', {'fields': ['number'], 'unique': True, 'sparse': True}]
+    }
+
+    # Functions called with the world and the names of the fields that changed each time one is saved or deleted
+    # (None when it is created or deleted). They keep in-memory state, like the world directory of the lobby,
+    # in sync with the database.
+    change_listeners = []
 
     def __init__(self, *args, save_on_creation=True, **kwargs):
         super().__init__(*args, **kwargs)
@@ -19,6 +30,14 @@ class World(mongoengine.Document):
             if save_on_creation:
                 self.save()
 
+    def save(self, *args, **kwargs):
+        if self.number is None:
+            self.number = world_number_counter_module.WorldNumberCounter.next_number()
+        changed_fields = None if self.id is None else {field.split('.')[0] for field in self._get_changed_fields()}
+        super().save(*args, **kwargs)
+        for listener in self.change_listeners:
+            listener(self, changed_fields)
+
     def add_snapshot(self, snapshot):
         self.snapshots.append(snapshot)
         self.save()
@@ -47,15 +66,16 @@ class World(mongoengine.Document):
             self.editors.remove(user)
             self.save()
 
-    def get_connected_users(self):
-        users = user_module.User.objects(client_id__ne=None, room__ne=None)
-        return len(list(filter(lambda u: u.room.world_state==self.world_state, users)))
-
-    def delete(self):
+    def ensure_can_be_deleted(self):
         for snapshot in self.snapshots:
             if snapshot.public:
                 raise CantDelete("Can't delete a world that has one or more of its snapshots published.")
-        for snapshot in self.snapshots:
-            snapshot.delete()
-        self.world_state.delete()
-        super().delete()
\ No newline at end of file
+
+    def delete(self):
+        """Deletes the world with its world state and snapshots. Returns a dict with the number of documents
+        deleted from each collection."""
+        self.ensure_can_be_deleted()
+        deleted = deletion_module.WorldDeleter(worlds=[self]).delete()
+        for listener in self.change_listeners:
+            listener(self, None)
+        return deleted
\ No newline at end of file
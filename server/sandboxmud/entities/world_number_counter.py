@@ -0,0 +1,32 @@
+import mongoengine
+import pymongo
+from . import world as world_module
+
+class WorldNumberCounter(mongoengine.Document):
+    """Last number given to a world. There is a single counter, whose id is COUNTER_ID."""
+    COUNTER_ID = 'world number'
+
+    id          = mongoengine.StringField(primary_key=True)
+    last_number = mongoengine.IntField(default=-1)
+
+    @classmethod
+    def next_number(cls):
+        """Returns a new number for a world. The number is allocated with an atomic $inc, so two worlds created
+        at the same time never get the same one, and the number of a deleted world is never given again."""
+        collection = cls._get_collection()
+        while True:
+            counter = collection.find_one_and_update(
+                {'_id': cls.COUNTER_ID}, {'$inc': {'last_number': 1}}, return_document=pymongo.ReturnDocument.AFTER)
+            if counter is not None:
+                return counter['last_number']
+            # first world numbered: the counter is created with the last number given before it existed
+            # (see the migration 0002_world_number), and the number is then allocated with $inc like any other
+            try:
+                collection.update_one({'_id': cls.COUNTER_ID}, {'$max': {'last_number': cls._get_last_legacy_number()}}, upsert=True)
+            except pymongo.errors.DuplicateKeyError:  # somebody else created the counter first
+                pass
+
+    @classmethod
+    def _get_last_legacy_number(cls):
+        last_world = world_module.World.objects(number__ne=None).order_by('-number').only('number').as_pymongo().first()
+        return -1 if last_world is None else last_world['number']
@@ -1,10 +1,18 @@
 import mongoengine
 from .exceptions import *
+from . import cloning as cloning_module
+from . import deletion as deletion_module
+from . import preserved_document as preserved_document_module
 
 class WorldSnapshot(mongoengine.Document):
     name = mongoengine.StringField(required=True)
     public = mongoengine.BooleanField(default=False)
-    snapshoted_state = mongoengine.ReferenceField('WorldState', required=True)
+    snapshoted_state = mongoengine.ReferenceField('WorldState', default=None)  # None while the snapshot is copy-on-write
+    cow_base = mongoengine.ReferenceField('WorldState', default=None)  # world state whose documents a copy-on-write snapshot shares
+
+    meta = {
+        'indexes': ['public', 'cow_base']
+    }
 
     def __init__(self, *args, save_on_creation=True, **kwargs):
         super().__init__(*args, **kwargs)
@@ -19,8 +27,24 @@ class WorldSnapshot(mongoengine.Document):
         self.public = False
         self.save()
 
+    def is_copy_on_write(self):
+        return self._data.get('cow_base') is not None
+
+    def clone_state(self):
+        """Returns a new WorldState with the contents of the snapshot."""
+        if self.is_copy_on_write():
+            return cloning_module.SnapshotCloner(self).clone()
+        return self.snapshoted_state.clone()
+
+    def materialize(self):
+        """Gives a copy-on-write snapshot its own WorldState, so it no longer shares the documents of cow_base."""
+        if self.is_copy_on_write():
+            self.snapshoted_state = self.clone_state()
+            self.cow_base = None
+            self.save()
+            preserved_document_module.PreservedDocument.objects(snapshot=self).delete()
+
     def delete(self):
         if self.public:
             raise CantDelete("Can't delete a public snapshot")
-        self.snapshoted_state.delete()
-        super().delete()
\ No newline at end of file
+        return deletion_module.WorldDeleter(snapshots=[self]).delete()
\ No newline at end of file
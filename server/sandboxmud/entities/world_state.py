@@ -1,14 +1,18 @@
 import mongoengine
-from . import inventory as inventory_module
-from . import item as item_module
+import pymongo
+from . import cloning as cloning_module
+from . import copy_on_write as copy_on_write_module
+from . import deletion as deletion_module
 from . import room as room_module
 from . import world as world_module
 
-class WorldState(mongoengine.Document):
+class WorldState(copy_on_write_module.CopyOnWrite, mongoengine.Document):
     starting_room = mongoengine.ReferenceField('Room', required=True)
     custom_verbs = mongoengine.ListField(mongoengine.ReferenceField('CustomVerb'))
     _next_room_id = mongoengine.IntField(default=1)
 
+    WORLD_STATE_FIELDS = ('_id',)
+
     def __init__(self, *args, save_on_creation=True, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -23,53 +27,37 @@ class WorldState(mongoengine.Document):
                 self.starting_room.save()
 
     def get_unique_room_id(self):
-        id_to_serve = str(self._next_room_id)
-        self._next_room_id = self._next_room_id + 1
-        self.save()
-        return id_to_serve
+        return self.reserve_room_ids(1)[0]
+
+    def reserve_room_ids(self, count):
+        """Returns a list of count room aliases that no other room of this world state will get.
+        They are reserved with a single atomic $inc, so several processes can create rooms at the same time.
+        """
+        if self.id is None:  # not in the database yet, so nobody else can be using it
+            first_id = self._next_room_id
+            self._next_room_id = first_id + count
+        else:
+            updated = WorldState._get_collection().find_one_and_update(
+                {'_id': self.id}, {'$inc': {'_next_room_id': count}},
+                projection={'_next_room_id': True}, return_document=pymongo.ReturnDocument.AFTER)
+            # not marked as changed, so a later save doesn't overwrite ids reserved by somebody else
+            self._data['_next_room_id'] = updated['_next_room_id']
+            first_id = updated['_next_room_id'] - count
+        return [str(room_id) for room_id in range(first_id, first_id + count)]
 
     def get_world(self):
         return next(world_module.World.objects(world_state=self))
 
     def add_custom_verb(self, custom_verb):
-        self.custom_verbs.append(custom_verb)
-        self.save()
+        self.modify(push__custom_verbs=custom_verb)
 
     def clone(self):
-        new_world_state = WorldState(_next_room_id=self._next_room_id, save_on_creation=False)
-
-        new_world_state.starting_room = self.starting_room.clone()
-        new_world_state.save()
-        new_world_state.starting_room.world_state = new_world_state
-        new_world_state.starting_room.save()
-
-        for custom_verb in self.custom_verbs:
-            new_world_state.custom_verbs.append(custom_verb.clone())
-
-        for room in room_module.Room.objects(world_state=self, alias__ne=self.starting_room.alias):
-            room.clone(new_world_state=new_world_state)
-
-        cloned_rooms = room_module.Room.objects(world_state=new_world_state)
-        exits_to_clone = [exit_to_clone for room in room_module.Room.objects(world_state=self) for exit_to_clone in room.exits]
-        for exit in exits_to_clone:
-            new_exit_location = next(filter(lambda r: r.alias==exit.room.alias, cloned_rooms))
-            new_exit_destination = next(filter(lambda r: r.alias==exit.destination.alias, cloned_rooms))
-            exit.clone(new_destination=new_exit_destination, new_room=new_exit_location)
-
-        for inventory in inventory_module.Inventory.objects(world_state=self):
-            inventory.clone(new_world_state=new_world_state)
-
-        saved_items = item_module.Item.objects(saved_in=self)
-        for saved_item in saved_items:
-            cloned_item = saved_item.clone(new_item_id=saved_item.item_id, new_saved_in=new_world_state)
-
-        new_world_state.save()
-        return new_world_state
+        return cloning_module.WorldStateCloner(self).clone()
 
     def get_rooms(self):
         return room_module.Room.objects(world_state=self)
 
     def delete(self):
-        for custom_verb in self.custom_verbs:
-            custom_verb.delete()
-        super().delete()
\ No newline at end of file
+        """Deletes the world state with all its documents. Returns a dict with the number of documents deleted
+        from each collection."""
+        return deletion_module.WorldDeleter(world_states=[self]).delete()
\ No newline at end of file
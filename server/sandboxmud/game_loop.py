@@ -0,0 +1,83 @@
+"""Defines the GameLoop class, that turns the events of a telnet server into Session calls.
+"""
+import asyncio
+import time
+from . import outbox as outbox_module
+from . import scheduler as scheduler_module
+from . import session as session_module
+
+
+class GameLoop:
+    """Keeps one Session per connected client and lets them handle the messages their clients send.
+    It works with any server that has the interface of telnetserver.TelnetServer:
+      - run_polling() asks the server for new events every POLLING_INTERVAL seconds.
+      - run() needs an AsyncTelnetServer, and processes events as soon as they arrive.
+    Sessions don't write to the server directly but to an Outbox, that is flushed at the end of each pass.
+    The messages of the clients go through a CommandScheduler, so no client can keep the rest waiting.
+    Long operations on whole worlds run as jobs of Session.jobs, whose notifications are handled in each pass.
+    """
+
+    POLLING_INTERVAL = 0.2  # seconds between polls of run_polling. We don't want to be using 100% CPU time.
+    JOB_POLLING_INTERVAL = 0.05  # seconds between checks for news of the running jobs in run
+
+    def __init__(self, server):
+        self.server = server
+        self.outbox = outbox_module.Outbox(server)  # collects the messages of each pass, used by the sessions as their server
+        self.scheduler = scheduler_module.CommandScheduler()
+        # Dict of current sessions. Keys are ids provided by the server, values are the user's Session object.
+        self.sessions = {}
+
+    def process_events(self):
+        """Handles the events made available by the last call to server.update()"""
+        # Handle new connections
+        for new_client in self.server.get_new_clients():
+            self.sessions[new_client] = session_module.Session(new_client, self.outbox)
+
+        # Handle disconnects
+        for disconnected_client in self.server.get_disconnected_clients():
+            if disconnected_client in self.sessions:
+                ended_session = self.sessions.pop(disconnected_client)
+                self.scheduler.remove(ended_session)
+                ended_session.disconnect()
+
+        # Queue the messages sent by each client
+        for sender_client, message in self.server.get_messages():
+            if sender_client in self.sessions:
+                session = self.sessions[sender_client]
+                if session.client_id is None:  # the session has disconnected by itself
+                    self.sessions.pop(sender_client)
+                    self.scheduler.remove(session)
+                else:
+                    self.scheduler.enqueue(session, message)
+
+        # Deliver the progress messages and completions of the background jobs
+        session_module.Session.jobs.process_notifications()
+
+        # Let the sessions handle the messages their turn allows
+        self.scheduler.process_messages()
+
+        # Write everything the sessions sent during this pass
+        self.outbox.flush()
+
+    def run_polling(self):
+        """Game loop for servers that must be polled, like telnetserver.TelnetServer."""
+        while True:
+            self.server.update()  # get new events
+            self.process_events()
+            time.sleep(self.POLLING_INTERVAL)
+
+    async def run(self):
+        """Game loop for an AsyncTelnetServer. It sleeps until a client does something,
+        or until the scheduler can process more of the messages it has queued. While there are jobs
+        running, it also wakes up every JOB_POLLING_INTERVAL seconds to deliver their notifications."""
+        await self.server.start()
+        while True:
+            wait_time = self.scheduler.get_wait_time()
+            if session_module.Session.jobs.running > 0:
+                wait_time = self.JOB_POLLING_INTERVAL if wait_time is None else min(wait_time, self.JOB_POLLING_INTERVAL)
+            try:
+                await asyncio.wait_for(self.server.wait_for_events(), wait_time)
+            except asyncio.TimeoutError:
+                pass
+            self.server.update()
+            self.process_events()
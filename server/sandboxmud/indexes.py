@@ -0,0 +1,75 @@
+"""Startup check of the database indexes.
+
+The entities declare their indexes in their meta, and mongoengine creates them the first time each collection
+is used. check_indexes() makes sure that happened, reports the indexes that are still missing (e.g. the unique
+index on user names can't be built while two users share a name) and asks the database how it would run the
+queries the game makes all the time, so a query that scans a whole collection is noticed at once.
+"""
+import logging
+import bson
+from . import entities
+
+# Queries made constantly while playing. The values don't matter, only the fields being filtered.
+_some_id = bson.ObjectId()
+HOT_QUERIES = {
+    'room by alias': lambda: entities.Room.objects(world_state=_some_id, alias='0'),
+    'items in room': lambda: entities.Item.objects(room=_some_id),
+    'items in world': lambda: entities.Item.objects(world_state=_some_id, name='x', visible='takable'),
+    'saved item': lambda: entities.Item.objects(saved_in=_some_id, item_id='x#1'),
+    'exits in room': lambda: entities.Exit.objects(room=_some_id),
+    'exits to room': lambda: entities.Exit.objects(destination=_some_id),
+    'users in room': lambda: entities.User.objects(room=_some_id, client_id__ne=None),
+    'user by name': lambda: entities.User.objects(name='x'),
+    'item id counter': lambda: entities.ItemIdCounter.objects(world_state=_some_id, name='x'),
+    'inventory': lambda: entities.Inventory.objects(user=_some_id, world_state=_some_id),
+    'world of world state': lambda: entities.World.objects(world_state=_some_id),
+    'world directory': lambda: entities.World.objects(number__ne=None).order_by('number'),
+    'copy-on-write snapshots': lambda: entities.WorldSnapshot.objects(cow_base__in=[_some_id]),
+    'public snapshots': lambda: entities.WorldSnapshot.objects(public=True),
+}
+
+DOCUMENTS = [entities.Room, entities.Item, entities.Exit, entities.User, entities.Inventory, entities.World,
+             entities.WorldState, entities.WorldSnapshot, entities.CustomVerb, entities.ItemIdCounter,
+             entities.WorldNumberCounter, entities.PreservedDocument]
+
+
+def check_indexes():
+    """Creates the declared indexes that don't exist yet and logs the ones that couldn't be created,
+    and the plan of each hot query. Returns a dict with the 'missing' indexes of each document class
+    and the 'plans' of the hot queries."""
+    logger = logging.getLogger('server_logger')
+    report = {'missing': {}, 'plans': {}}
+
+    for document_class in DOCUMENTS:
+        try:
+            document_class.ensure_indexes()
+        except Exception as error:  # e.g. duplicate key error building a unique index
+            logger.warning('could not create the indexes of {}: {}'.format(document_class.__name__, error))
+        # the _id index is only reported missing because the collection doesn't exist yet
+        missing = [index for index in document_class.compare_indexes()['missing'] if index != [('_id', 1)]]
+        if missing:
+            report['missing'][document_class.__name__] = missing
+            logger.warning('missing indexes in {}: {}'.format(document_class.__name__, missing))
+
+    for name, query in HOT_QUERIES.items():
+        try:
+            plan = query().explain()['queryPlanner']['winningPlan']
+        except Exception:  # not every database, e.g. mongomock, explains its queries
+            plan = None
+        report['plans'][name] = _describe_plan(plan)
+        level = logging.WARNING if 'COLLSCAN' in report['plans'][name] else logging.INFO
+        logger.log(level, 'query plan of {}: {}'.format(name, report['plans'][name]))
+
+    return report
+
+
+def _describe_plan(plan):
+    """Returns the stages of a winning plan, from the outermost to the innermost, e.g. 'FETCH > IXSCAN'."""
+    if plan is None:
+        return 'unknown'
+    plan = plan.get('queryPlan', plan)  # newer servers nest the plan one level deeper
+    stages = []
+    while plan is not None:
+        stages.append(plan.get('stage', '?'))
+        plan = plan.get('inputStage') or (plan.get('inputStages') or [None])[0]
+    return ' > '.join(stages)
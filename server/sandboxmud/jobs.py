@@ -0,0 +1,129 @@
+"""Defines the JobRunner class, that runs long operations on whole worlds without stopping the game loop.
+"""
+import collections
+import concurrent.futures
+import logging
+import queue
+import threading
+
+
+class ClientGone(Exception):
+    """Raised in a job that waits for its client to read its output, when the client disconnects or stops reading"""
+
+
+class JobProgress:
+    """Passed to the work of each job. Calling it with a message sends it to the client of the job's session."""
+
+    def __init__(self, runner, session):
+        self.runner = runner
+        self.session = session
+
+    def __call__(self, message):
+        self.runner._notifications.put(lambda: self.session.send_to_client(message))
+
+    def wait_for_client(self, max_pending_bytes, timeout):
+        """Blocks until the client has read the messages sent so far, except at most max_pending_bytes. Jobs that
+        send a lot of output call it between messages, so they don't run ahead of a slow client, whose output
+        would be cut by the server. Raises ClientGone if the client disconnects, or doesn't read for timeout seconds."""
+        waiter = _ClientWaiter(self.session, max_pending_bytes)
+        self.runner._notifications.put(lambda: self.runner._waiters.append(waiter))
+        if not waiter.done.wait(timeout):
+            waiter.gone = True  # the game loop forgets it the next time it looks at it
+            raise ClientGone('the client has not read its output for {} seconds'.format(timeout))
+        if waiter.gone:
+            raise ClientGone('the client disconnected')
+
+
+class _ClientWaiter:
+    def __init__(self, session, max_pending_bytes):
+        self.session = session
+        self.max_pending_bytes = max_pending_bytes
+        self.done = threading.Event()
+        self.gone = False
+
+
+class JobRunner:
+    """Runs jobs, like deploying a snapshot or exporting a world, in a pool of worker threads.
+
+    Sessions and the outbox are only touched from the game loop, so jobs don't talk to their session directly.
+    The progress messages they send and their completion are queued as notifications, and the game loop
+    handles them in each pass, calling process_notifications().
+
+    While a job is running, the world states it works on are locked: verbs that change a world check
+    is_locked() and refuse to run, so the job never sees a world half way through a change.
+    """
+
+    MAX_WORKERS = 2
+    WAIT_POLLING_INTERVAL = 0.05  # seconds wait() sleeps between checks of the jobs waiting for their client
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix='job')
+        self._notifications = queue.SimpleQueue()  # functions to be called from the game loop
+        self._locks = collections.Counter()  # world state id -> number of running jobs that locked it
+        self._waiters = []  # _ClientWaiter of the jobs waiting for their client to read
+        self.running = 0
+
+    def submit(self, session, work, on_done=None, locked_world_states=()):
+        """Runs work(progress) in a worker thread. work can call progress(message) to send message to the client of
+        session, and progress.wait_for_client to wait for the client to read it (see JobProgress). When it finishes, on_done(result) is called from the game loop with the value work returned.
+        If work raises an exception, the client is told that the operation failed and on_done isn't called.
+        Must be called from the game loop."""
+        world_state_ids = [getattr(world_state, 'id', world_state) for world_state in locked_world_states if world_state is not None]
+        self._locks.update(world_state_ids)
+        self.running += 1
+
+        progress = JobProgress(self, session)
+
+        def run():
+            try:
+                result = work(progress)
+            except Exception:
+                logging.getLogger('server_logger').exception('job failed')
+                self._notifications.put(lambda: self._finish(world_state_ids, session.send_to_client, 'La operación no se ha podido completar.'))
+            else:
+                self._notifications.put(lambda: self._finish(world_state_ids, on_done, result))
+
+        self.executor.submit(run)
+
+    def _finish(self, world_state_ids, callback, argument):
+        self._locks.subtract(world_state_ids)
+        self._locks += collections.Counter()  # drops the world states that are no longer locked
+        self.running -= 1
+        if callback is not None:
+            callback(argument)
+
+    def is_locked(self, world_state_id):
+        return self._locks[world_state_id] > 0
+
+    def process_notifications(self):
+        """Handles the progress messages and completions of the jobs that arrived since the last call, and wakes
+        up the jobs whose client has read enough of their output."""
+        while True:
+            try:
+                notification = self._notifications.get_nowait()
+            except queue.Empty:
+                break
+            notification()
+        if self._waiters:
+            self._waiters = [waiter for waiter in self._waiters if not self._wake_up(waiter)]
+
+    def _wake_up(self, waiter):
+        """Wakes up the job of waiter if its client has read enough, or is gone. Returns True if it did."""
+        if not waiter.gone:
+            pending = waiter.session.get_pending_output()
+            if pending is None:
+                waiter.gone = True
+            elif pending > waiter.max_pending_bytes:
+                return False
+        waiter.done.set()
+        return True
+
+    def wait(self):
+        """Blocks until all the jobs have finished and their notifications have been handled.
+        Meant for tools and scripts that drive sessions without a game loop."""
+        while self.running > 0:
+            try:
+                self._notifications.get(timeout=self.WAIT_POLLING_INTERVAL)()
+            except queue.Empty:
+                pass
+            self.process_notifications()  # also wakes up the jobs waiting for their client
@@ -0,0 +1,45 @@
+"""Database migrations, run when the server starts.
+
+Each migration is a function that brings the documents written by older versions of the server up to date.
+The ones already applied are recorded in the 'migrations' collection, so each one runs only once per database.
+"""
+import logging
+from . import entities
+
+
+def backfill_item_and_exit_world_state(db):
+    """Items and exits know the world state of the room or inventory they are in since the field world_state was added."""
+    items = entities.Item._get_collection()
+    exits = entities.Exit._get_collection()
+    for room in entities.Room.objects(world_state__ne=None).only('id', 'world_state').as_pymongo():
+        items.update_many({'room': room['_id']}, {'$set': {'world_state': room['world_state']}})
+        exits.update_many({'room': room['_id']}, {'$set': {'world_state': room['world_state']}})
+    for inventory in entities.Inventory.objects.only('items', 'world_state').as_pymongo():
+        if inventory.get('items'):
+            items.update_many({'_id': {'$in': inventory['items']}}, {'$set': {'world_state': inventory['world_state']}})
+
+
+def number_worlds(db):
+    """Worlds have a stable number in the lobby since the field number was added. The existing ones are numbered
+    in the order they were created, which is the order the lobby listed them in."""
+    worlds = entities.World._get_collection()
+    for number, world in enumerate(worlds.find({}, {'_id': 1}).sort('_id', 1)):
+        worlds.update_one({'_id': world['_id']}, {'$set': {'number': number}})
+
+
+# All the migrations, in the order they must be applied. Never remove or rename one already released.
+MIGRATIONS = [
+    ('0001_item_and_exit_world_state', backfill_item_and_exit_world_state),
+    ('0002_world_number', number_worlds),
+]
+
+
+def run_pending_migrations():
+    """Applies the migrations that haven't been applied to the database yet."""
+    db = entities.Item._get_db()
+    applied = {migration['_id'] for migration in db.migrations.find()}
+    for name, migration in MIGRATIONS:
+        if name not in applied:
+            logging.getLogger('server_logger').info('applying migration {}'.format(name))
+            migration(db)
+            db.migrations.insert_one({'_id': name})
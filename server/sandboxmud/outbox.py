@@ -0,0 +1,44 @@
+"""Defines the Outbox class, that groups the messages sent to each client during a game loop pass.
+"""
+
+
+class Outbox:
+    """Stands between the sessions and the telnet server. It has the server's send_message method,
+    but instead of writing right away, it keeps the messages of each client until flush() is called.
+    Then it writes all of them with a single send_message call per client, in the order they were sent.
+
+    The game loop flushes the outbox at the end of each pass, so a command that sends several
+    messages to the same client (e.g. Go: departure, arrival and the room description) produces
+    one write instead of several.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self._pending = {}  # client id -> list of messages not yet written, in order
+        self.messages_sent = 0  # number of send_message calls received
+        self.writes = 0  # number of send_message calls made to the server
+
+    def send_message(self, to, message):
+        """Queues message to be sent to the client with the id 'to' on the next flush."""
+        self._pending.setdefault(to, []).append(message)
+        self.messages_sent += 1
+
+    def flush(self):
+        """Sends all the queued messages to the server, one call per client."""
+        pending, self._pending = self._pending, {}
+        for client_id, messages in pending.items():
+            # the server ends each message with "\n\r", so the joined message produces exactly the same output
+            self.server.send_message(client_id, "\n\r".join(messages))
+            self.writes += 1
+
+    def get_pending_bytes(self, client_id):
+        """Returns about how many bytes are waiting to be sent to a client, here and in the server, or None if the
+        server knows the client isn't connected. Servers that don't keep a queue per client count as empty."""
+        server_pending = self.server.get_pending_bytes(client_id) if hasattr(self.server, 'get_pending_bytes') else 0
+        if server_pending is None:
+            return None
+        return server_pending + sum(len(message) for message in self._pending.get(client_id, ()))
+
+    def get_stats(self):
+        """Returns a dict with the number of messages sent and the writes needed to send them."""
+        return {'messages': self.messages_sent, 'writes': self.writes}
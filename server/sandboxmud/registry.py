@@ -0,0 +1,92 @@
+"""Defines the SessionRegistry class, an in-memory index of the sessions that are online.
+"""
+from . import util
+
+
+class SessionRegistry:
+    """Process-wide index of the live sessions, so questions like "which session is this user
+    playing in?" or "who is in this room?" don't need a database query.
+    Only sessions with a logged in user are registered. Ghost sessions never are.
+
+    Sessions are indexed by the room of their user, and by the world state that room belongs to
+    (None for users in the lobby). The indexes are updated when a session is added or removed, and
+    through user_saved, which is called each time a User is saved (after moving, teleporting,
+    entering a world, etc.)
+    """
+
+    def __init__(self):
+        self._sessions_by_user = {}  # user id -> Session
+        self._sessions_by_room = {}  # room id -> dict whose keys are the sessions in the room (an ordered set)
+        self._room_by_session = {}   # Session -> id of the room where it is indexed
+        self._sessions_by_world_state = {}  # world state id -> dict whose keys are the sessions in it
+        self._world_state_by_room = {}  # room id -> id of its world state, for the rooms with sessions
+
+    def add(self, session):
+        """Registers a session whose user has just logged in."""
+        self._sessions_by_user[session.user.id] = session
+        self._index(session)
+
+    def remove(self, session):
+        """Unregisters a session, if it is the one registered for its user."""
+        if session.user is not None and self._sessions_by_user.get(session.user.id) is session:
+            del self._sessions_by_user[session.user.id]
+            self._unindex(session)
+
+    def get_session(self, user):
+        """Returns the live session of user, or None if the user is not online."""
+        return self._sessions_by_user.get(user.id)
+
+    def get_sessions(self):
+        """Returns all the live sessions."""
+        return list(self._sessions_by_user.values())
+
+    def get_sessions_in_room(self, room_id):
+        """Returns the live sessions whose user is in the room with id room_id."""
+        return list(self._sessions_by_room.get(room_id, ()))
+
+    def get_sessions_in_world_state(self, world_state_id):
+        """Returns the live sessions whose user is in a room of the world state with id world_state_id."""
+        return list(self._sessions_by_world_state.get(world_state_id, ()))
+
+    def count_sessions_in_world_state(self, world_state_id):
+        """Returns how many live sessions have their user in a room of the world state with id world_state_id."""
+        return len(self._sessions_by_world_state.get(world_state_id, ()))
+
+    def user_saved(self, user):
+        """Called each time a User is saved. If the user is online, but the saved instance isn't the one
+        held by its session (e.g. another player teleported them), the session adopts it, since it is the
+        most up to date one. Then the session is indexed again, in case the user changed rooms.
+        """
+        session = self._sessions_by_user.get(user.id)
+        if session is None:
+            return
+        if session.user is not user:
+            session.user = user
+        self._index(session)
+
+    def _index(self, session):
+        room_id = util.reference_id(session.user, 'room')
+        if session in self._room_by_session and self._room_by_session[session] == room_id:
+            return
+        self._unindex(session)
+        if room_id not in self._world_state_by_room:
+            # rooms never change world state, so the room is only loaded by the first session to enter it
+            self._world_state_by_room[room_id] = None if room_id is None else util.reference_id(session.user.room, 'world_state')
+        self._room_by_session[session] = room_id
+        self._sessions_by_room.setdefault(room_id, {})[session] = None
+        self._sessions_by_world_state.setdefault(self._world_state_by_room[room_id], {})[session] = None
+
+    def _unindex(self, session):
+        if session not in self._room_by_session:
+            return
+        room_id = self._room_by_session.pop(session)
+        sessions_in_room = self._sessions_by_room[room_id]
+        del sessions_in_room[session]
+        world_state_id = self._world_state_by_room[room_id]
+        sessions_in_world_state = self._sessions_by_world_state[world_state_id]
+        del sessions_in_world_state[session]
+        if not sessions_in_room:
+            del self._sessions_by_room[room_id]
+            del self._world_state_by_room[room_id]
+        if not sessions_in_world_state:
+            del self._sessions_by_world_state[world_state_id]
@@ -0,0 +1,103 @@
+"""Defines the CommandScheduler class, that decides which of the messages sent by the clients are processed in each game loop pass.
+"""
+import collections
+import time
+
+
+class CommandScheduler:
+    """Keeps the messages received from each session in a queue and processes them fairly:
+      - Sessions take turns, one message each, until their queues are empty or their budget for
+        the pass (MESSAGES_PER_PASS) is spent. The session that starts each pass rotates.
+      - Each session has a token bucket: it earns RATE tokens per second, up to BURST, and each
+        message processed costs one. A session without tokens waits, but its messages are kept.
+    This way a client pasting hundreds of lines, or spamming a custom verb, doesn't make everyone else wait.
+
+    Sessions whose current verb has bulk_input (like ImportWorld, that receives a world as many
+    messages) don't spend tokens, but still take turns with the rest.
+    """
+
+    MESSAGES_PER_PASS = 5  # max messages of a single session processed in a pass
+    RATE = 5.0  # tokens earned by each session per second
+    BURST = 20.0  # max tokens of a session
+
+    class _Queue:
+        """Messages of a session waiting to be processed, and its token bucket"""
+
+        def __init__(self, tokens, now):
+            self.messages = collections.deque()
+            self.tokens = tokens
+            self.last_refill = now
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._queues = {}  # Session -> _Queue
+        self._turns = collections.deque()  # sessions with messages waiting, in the order they will be served
+
+    def enqueue(self, session, message):
+        """Adds a message sent by the client of session."""
+        queue = self._queues.get(session)
+        if queue is None:
+            queue = self._queues[session] = self._Queue(self.BURST, self.clock())
+        if not queue.messages:
+            self._turns.append(session)
+        queue.messages.append(message)
+
+    def remove(self, session):
+        """Discards the waiting messages of a session that has ended."""
+        self._queues.pop(session, None)
+        if session in self._turns:
+            self._turns.remove(session)
+
+    def has_pending(self):
+        return bool(self._turns)
+
+    def get_wait_time(self):
+        """Returns the seconds until some waiting message can be processed, 0 if one can be now,
+        or None if there are no messages waiting."""
+        if not self._turns:
+            return None
+        now = self.clock()
+        wait_time = None
+        for session in self._turns:
+            queue = self._queues[session]
+            self._refill(queue, now)
+            if queue.tokens >= 1 or self._is_bulk_input(session):
+                return 0
+            session_wait_time = (1 - queue.tokens) / self.RATE
+            if wait_time is None or session_wait_time < wait_time:
+                wait_time = session_wait_time
+        return wait_time
+
+    def process_messages(self):
+        """Lets the sessions process the messages they can in this pass."""
+        now = self.clock()
+        budgets = {session: self.MESSAGES_PER_PASS for session in self._turns}
+        waiting = collections.deque()  # sessions with messages left that can't process more in this pass
+        while self._turns:
+            session = self._turns.popleft()
+            queue = self._queues[session]
+            if session.client_id is None:  # the session has been closed, e.g. taken over by another one
+                self._queues.pop(session)
+                continue
+            self._refill(queue, now)
+            bulk_input = self._is_bulk_input(session)
+            if budgets[session] <= 0 or (queue.tokens < 1 and not bulk_input):
+                waiting.append(session)
+                continue
+            budgets[session] -= 1
+            if not bulk_input:
+                queue.tokens -= 1
+            session.process_message(queue.messages.popleft())
+            if queue.messages:
+                self._turns.append(session)
+        # the first session served in the next pass is the one after the first served in this one
+        if waiting:
+            waiting.rotate(-1)
+        self._turns = waiting
+
+    def _refill(self, queue, now):
+        queue.tokens = min(self.BURST, queue.tokens + (now - queue.last_refill) * self.RATE)
+        queue.last_refill = now
+
+    def _is_bulk_input(self, session):
+        return getattr(session.current_verb, 'bulk_input', False)
@@ -3,6 +3,9 @@
 from . import entities
 from . import verbs as v
 from . import util
+from . import directory as directory_module
+from . import registry as registry_module
+from . import jobs as jobs_module
 
 class Session:
     """This class handles interaction with a single user, though it can send messages to other users as well, to inform them of the session's user actions.
@@ -14,7 +17,19 @@ class Session:
     """
 
     # List of all verbs supported by the session, ordered by priority: if two verbs can handle the same message, the first will have preference.
-    verbs = [v.ExportWorld, v.ImportWorld, v.DeleteWorld, v.EnterWorld, v.CreateWorld, v.DeployPublicSnapshot, v.GoToLobby, v.CustomVerb, v.Build, v.Emote, v.Go, v.Help, v.Look, v.Remodel, v.Say, v.Shout, v.Craft, v.EditItem, v.Connect, v.TeleportClient, v.TeleportUser, v.TeleportAllInRoom, v.TeleportAllInWorld, v.DeleteRoom, v.DeleteItem, v.DeleteExit, v.WorldInfo, v.Info, v.Items, v.Exits, v.AddVerb, v.MasterMode, v.TextToOne, v.TextToRoom, v.TextToRoomUnless, v.TextToWorld, v.Take, v.Drop, v.Inventory, v.MasterOpen, v.MasterClose, v.AssignKey, v.Open, v.SaveItem, v.PlaceItem, v.CreateSnapshot, v.DeploySnapshot, v.CheckForItem, v.Give, v.TakeFrom, v.ChangeEditFreedom, v.MakeEditor, v.RemoveEditor, v.PubishSnapshot, v.UnpubishSnapshot, v.DeleteSnapshot, v.InspectCustomVerb, v.DeleteCustomVerb, v.EditWorld]
+    verbs = [v.ExportWorld, v.ImportWorld, v.DeleteWorld, v.EnterWorld, v.SearchWorlds, v.ShowWorldsPage, v.CreateWorld, v.DeployPublicSnapshot, v.GoToLobby, v.CustomVerb, v.Build, v.Emote, v.Go, v.Help, v.Look, v.Remodel, v.Say, v.Shout, v.Craft, v.EditItem, v.Connect, v.TeleportClient, v.TeleportUser, v.TeleportAllInRoom, v.TeleportAllInWorld, v.DeleteRoom, v.DeleteItem, v.DeleteExit, v.WorldInfo, v.Info, v.Items, v.Exits, v.AddVerb, v.MasterMode, v.TextToOne, v.TextToRoom, v.TextToRoomUnless, v.TextToWorld, v.Take, v.Drop, v.Inventory, v.MasterOpen, v.MasterClose, v.AssignKey, v.Open, v.SaveItem, v.PlaceItem, v.CreateSnapshot, v.DeploySnapshot, v.CheckForItem, v.Give, v.TakeFrom, v.ChangeEditFreedom, v.MakeEditor, v.RemoveEditor, v.PubishSnapshot, v.UnpubishSnapshot, v.DeleteSnapshot, v.InspectCustomVerb, v.DeleteCustomVerb, v.EditWorld]
+
+    # Index of the verbs above, used to find the verb for each message without asking all of them.
+    dispatcher = v.VerbDispatcher(verbs)
+
+    # Index of the sessions that are online, shared by all of them.
+    registry = registry_module.SessionRegistry()
+
+    # Runs the operations on whole worlds in the background, shared by all the sessions.
+    jobs = jobs_module.JobRunner()
+
+    # Worlds listed in the lobby, shared by all the sessions.
+    directory = directory_module.WorldDirectory()
 
     def __init__(self, client_id, server):
         self.logger = None  # logger for recording user interaction
@@ -22,29 +37,22 @@ class Session:
         self.client_id = client_id  # direction to send messages to our client
         self.current_verb = v.Login(self)  # verb that is currently handling interaction. It starts with the log-in process.
         self.user = None  # here we'll have an User entity once the log-in is completed.
+        self.lobby_search = None  # text the worlds listed in the lobby are filtered by, if any.
         
 
 
     def process_message(self, message):
         """This method processes a message sent by the client.
-        It polls all verbs, using their can_process method to find a verb that can process the message.
+        If there isn't a current_verb, it uses the dispatcher to find a verb that can process the message.
         Then makes that verb the current_verb and lets it handle the message.
         """
-        if self.user is not None:
-            self.user.reload()
-            if self.user.client_id != self.client_id:  # another session has been opened for the same user
-                self.send_to_client('Otra sesión ha sido abierta para el mismo usuario. Tu sesión ha sido cerrada.')
-                self.disconnect()
-                return
-
         if self.logger:
             self.logger.info('client\n'+message)
         
         if self.current_verb is None:
-            for verb in self.verbs:
-                if verb.can_process(message, self):
-                    self.current_verb = verb(self)
-                    break
+            verb = self.dispatcher.find_verb(message, self)
+            if verb is not None:
+                self.current_verb = verb(self)
         
         if self.current_verb is not None:
             self.current_verb.execute(message)
@@ -53,12 +61,38 @@ class Session:
         else:
             self.send_to_client("No te entiendo.")
 
-    def disconnect(self):
+    def log_in(self, user):
+        """Makes user the user of this session. If the user was being played in another session,
+        that session is closed.
+        """
+        previous_session = self.registry.get_session(user)
+        if previous_session is not None and previous_session is not self:
+            previous_session.close('Otra sesión ha sido abierta para el mismo usuario. Tu sesión ha sido cerrada.')
+        self.user = user
+        self.user.connect(self.client_id)
+        self.registry.add(self)
+
+    def close(self, message):
+        """Ends the session without disconnecting its user, because another session took it over."""
+        self.send_to_client(message)
+        self.registry.remove(self)
         self.client_id = None
-        if self.user is not None and self.user.client_id == self.client_id:
-            if not self.user.master_mode:
+
+    def disconnect(self):
+        if self.user is not None and self.registry.get_session(self.user) is self:
+            self.registry.remove(self)
+            if not self.user.master_mode and self.user.room is not None:
                 self.send_to_others_in_room("¡Whoop! {} se ha esfumado.".format(self.user.name))
             self.user.disconnect()
+        self.client_id = None
+
+    def get_pending_output(self):
+        """Returns about how many bytes sent to the client it hasn't read yet, or None if it is no longer connected."""
+        if self.client_id is None:
+            return None
+        if not hasattr(self.server, 'get_pending_bytes'):
+            return 0
+        return self.server.get_pending_bytes(self.client_id)
 
     def send_to_client(self, message):
         self.server.send_message(self.client_id, "\n\r"+message)
@@ -70,26 +104,26 @@ class Session:
             self.server.send_message(user.client_id, "\n\r"+message)
 
     def send_to_room_except(self, exception_user, message):
-        users_in_this_room = entities.User.objects(room=self.user.room)
-        for user in users_in_this_room:
-            if user != exception_user:
-                self.server.send_message(user.client_id, message)
+        for session in self.registry.get_sessions_in_room(util.reference_id(self.user, 'room')):
+            if session.user != exception_user:
+                self.server.send_message(session.client_id, message)
 
     def send_to_others_in_room(self, message):
         self.send_to_room_except(self.user, message)
-        """users_in_this_room = entities.User.objects(room=self.user.room)
-        for user in users_in_this_room:
-            if user != self.user:
-                self.server.send_message(user.client_id, message)"""
 
     def send_to_room(self, message):
-        users_in_this_room = entities.User.objects(room=self.user.room)
-        for user in users_in_this_room:
-            self.server.send_message(user.client_id, message)
+        for session in self.registry.get_sessions_in_room(util.reference_id(self.user, 'room')):
+            self.server.send_message(session.client_id, message)
+
+    def send_to_world(self, message):
+        world_state_id = None if self.user.room is None else util.reference_id(self.user.room, 'world_state')
+        for session in self.registry.get_sessions_in_world_state(world_state_id):
+            self.server.send_message(session.client_id, message)
 
     def send_to_all(self, message):
-        for user in entities.User.objects:
-            self.server.send_message(user.client_id, message)
+        """Sends message to every user online, whatever their world. Meant for server-wide announcements."""
+        for session in self.registry.get_sessions():
+            self.server.send_message(session.client_id, message)
 
     def set_logger(self, logger):
         self.logger = logger
@@ -138,4 +172,8 @@ class GhostSessionMaxDepthExceeded(Exception):
     """
     Raised when there are too many nested custom verbs in execution.
     i.e. when a custom verb is used that uses another custom verb, and so on.
-    """
\ No newline at end of file
+    """
+
+
+entities.User.save_listeners.append(Session.registry.user_saved)
+entities.World.change_listeners.append(Session.directory.world_changed)
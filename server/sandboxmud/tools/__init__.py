@@ -0,0 +1 @@
+"""Tools for developers and operators of the server. Run them with python -m sandboxmud.tools.<tool>."""
@@ -0,0 +1,93 @@
+"""
+World archives: backs up a world to a file, or restores it from one, straight from the database.
+
+    python -m sandboxmud.tools.archive [-d mongo_db_database_uri] export world file
+    python -m sandboxmud.tools.archive [-d mongo_db_database_uri] [-n name] import file creator
+
+export writes the current state of the world (given by its name or its id) to a new archive file.
+import creates a new world from an archive file. Its creator is the user with that name, who also gets
+the items that were in inventories when the world was archived. The format of the files is described
+in sandboxmud/archive.py.
+
+It can be used while the server is running, but changes made to a world while it's being exported may
+be only partially in the archive.
+
+Options:
+    -d, --database database to use. If you don't specify an URI, will try to connect to default docker-compose db.
+    -n, --name     name of the imported world (default: the one it had when it was archived)
+"""
+import bson
+import getopt
+import sys
+import time
+
+
+def connect_to_database(uri):
+    import mongoengine
+    if uri:
+        mongoengine.connect(host=uri)
+    else:
+        mongoengine.connect('sandboxmud', host='mud-db')
+
+
+def find_world(name_or_id):
+    from .. import entities
+    if bson.ObjectId.is_valid(name_or_id):
+        world = entities.World.objects(id=name_or_id).first()
+        if world is not None:
+            return world
+    worlds = list(entities.World.objects(name=name_or_id))
+    if not worlds:
+        sys.exit('There is no world called {}.'.format(name_or_id))
+    if len(worlds) > 1:
+        sys.exit('There are {} worlds called {}, give the id of one of them: {}'.format(
+            len(worlds), name_or_id, ', '.join(str(world.id) for world in worlds)))
+    return worlds[0]
+
+
+def export_world(name_or_id, path):
+    from .. import archive
+    world = find_world(name_or_id)
+    started = time.perf_counter()
+    rooms = archive.export_world(world, path)
+    print('{} rooms of {} archived in {} ({:.2f} s)'.format(rooms, world.name, path, time.perf_counter() - started))
+
+
+def import_world(path, creator_name, name):
+    from .. import archive
+    from .. import entities
+    creator = entities.User.objects(name=creator_name).first()
+    if creator is None:
+        sys.exit('There is no user called {}.'.format(creator_name))
+    started = time.perf_counter()
+    try:
+        world = archive.import_world(path, creator, name)
+    except archive.BadArchive as error:
+        sys.exit('Could not read {}: {}'.format(path, error))
+    except entities.BadItem as error:
+        sys.exit('The world has items or exits with empty, malformed or repeated names: {}'.format(error))
+    print('{} imported as {} ({}) in {:.2f} s'.format(path, world.name, world.id, time.perf_counter() - started))
+
+
+if __name__ == "__main__":
+    database = None
+    name = None
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'd:n:', ['database=', 'name='])
+        for opt, arg in opts:
+            if opt in ('-d', '--database'):
+                database = arg
+            elif opt in ('-n', '--name'):
+                name = arg
+        if len(args) != 3 or args[0] not in ('export', 'import'):
+            raise getopt.GetoptError('expected export world file, or import file creator')
+    except getopt.GetoptError as error:
+        print(error)
+        print(__doc__)
+        sys.exit(2)
+
+    connect_to_database(database)
+    if args[0] == 'export':
+        export_world(args[1], args[2])
+    else:
+        import_world(args[1], args[2], name)
@@ -0,0 +1,213 @@
+"""
+Benchmarks: measures how long the most common verbs and world operations take on worlds of increasing size.
+
+    python -m sandboxmud.tools.benchmark [-s sizes] [-r repeats] [-o output_file] [-d mongo_db_database_uri]
+
+Sessions are driven directly, with a fake server that keeps the messages they send, so no sockets are
+involved. For each size, a synthetic world is built with that many rooms in a row, each one with a few
+items (one of them takable) and a custom verb, plus a chain of world custom verbs that call each other.
+Then these cases are timed:
+    look        Look.show_current_room in a room with items and exits
+    go          Go back and forth between two rooms
+    take_drop   Take an item and drop it again
+    verb_chain  a world CustomVerb that runs a chain of CUSTOM_VERB_CHAIN_LENGTH nested custom verbs
+    clone       WorldState.clone of the whole world
+    export      ExportWorld of the whole world, until its job finishes
+    import      ImportWorld of the exported world, until its job finishes
+
+The results are written as JSON, so the files of two releases can be compared.
+
+By default the benchmark runs on an in-memory mongomock database (mongomock must be installed). With -d it
+uses the given database instead. ALL ITS COLLECTIONS ARE DROPPED, so give it a scratch database.
+
+Options:
+    -s, --sizes    comma separated numbers of rooms of the synthetic worlds (default 10,40,160)
+    -r, --repeats  times each case is run for each size (default 5)
+    -o, --output   file where the JSON results are written (default: standard output)
+    -l, --label    text saved with the results, e.g. the version being measured
+    -d, --database database to run the benchmark on
+"""
+import datetime
+import getopt
+import json
+import platform
+import statistics
+import sys
+import time
+
+ITEMS_PER_ROOM = 3
+CUSTOM_VERB_CHAIN_LENGTH = 5
+
+
+class FakeServer:
+    """Has the send_message method of the telnet servers, but only keeps the messages."""
+
+    def __init__(self):
+        self.messages = []  # (client id, message) tuples
+
+    def send_message(self, to, message):
+        self.messages.append((to, message))
+
+
+def connect_to_database(uri):
+    import mongoengine
+    if uri:
+        mongoengine.connect('sandboxmud_benchmark', host=uri)
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit('The benchmark needs mongomock (pip install mongomock), or a database given with -d.')
+        mongoengine.connect('sandboxmud_benchmark', host='mongodb://localhost', mongo_client_class=mongomock.MongoClient)
+
+
+def clear_database():
+    from .. import entities
+    for document_class in [entities.User, entities.Item, entities.Room, entities.CustomVerb, entities.World,
+                           entities.WorldState, entities.WorldSnapshot, entities.Exit, entities.Inventory,
+                           entities.ItemIdCounter, entities.WorldNumberCounter, entities.PreservedDocument]:
+        document_class.drop_collection()
+
+
+def build_world(size, creator):
+    """Creates a world with size rooms in a row, connected by 'norte' and 'sur' exits. Returns it."""
+    from .. import entities
+    world = entities.World(name='benchmark {}'.format(size), creator=creator)
+    world_state = world.world_state
+
+    rooms = [world_state.starting_room]
+    for room_number in range(1, size):
+        rooms.append(entities.Room(name='sala {}'.format(room_number), description='Una sala cualquiera.', world_state=world_state))
+    for room, next_room in zip(rooms, rooms[1:]):
+        entities.Exit(name='norte', destination=next_room, room=room)
+        entities.Exit(name='sur', destination=room, room=next_room)
+
+    for room_number, room in enumerate(rooms):
+        for item_number in range(ITEMS_PER_ROOM):
+            visible = 'takable' if item_number == 0 else 'listed'
+            entities.Item(name='cosa {}-{}'.format(room_number, item_number), description='Una cosa cualquiera.', visible=visible, room=room)
+        room.add_custom_verb(entities.CustomVerb(names=['saltar'], commands=["textoa '.usuario' Saltas."]))
+
+    # cadena0 runs cadena1, that runs cadena2... and the last one sends a message to the user
+    for link in range(CUSTOM_VERB_CHAIN_LENGTH):
+        if link < CUSTOM_VERB_CHAIN_LENGTH - 1:
+            commands = ['cadena{}'.format(link + 1)]
+        else:
+            commands = ["textoa '.usuario' Fin de la cadena."]
+        world_state.add_custom_verb(entities.CustomVerb(names=['cadena{}'.format(link)], commands=commands))
+    return world
+
+
+def start_session(server, client_id, user):
+    """Returns a Session with user logged in."""
+    from .. import session as session_module
+    session = session_module.Session(client_id, server)
+    session.current_verb = None  # skip the log-in verb
+    session.log_in(user)
+    return session
+
+
+def time_case(server, repeats, run, set_up=None, tear_down=None):
+    """Calls set_up, run and tear_down repeats times, timing only run. set_up returns the argument of
+    run, and run the argument of tear_down. Returns a dict with the results."""
+    times = []
+    messages = 0
+    for _ in range(repeats):
+        argument = set_up() if set_up is not None else None
+        messages_before = len(server.messages)
+        started = time.perf_counter()
+        result = run(argument)
+        times.append(time.perf_counter() - started)
+        messages += len(server.messages) - messages_before
+        if tear_down is not None:
+            tear_down(result)
+    return {
+        'repeats': repeats,
+        'mean_ms': statistics.mean(times) * 1000,
+        'median_ms': statistics.median(times) * 1000,
+        'min_ms': min(times) * 1000,
+        'max_ms': max(times) * 1000,
+        'messages_per_run': messages / repeats,
+    }
+
+
+def run_cases(size, repeats):
+    """Builds a world of size rooms and times all the cases on it. Returns a dict with the results of each case."""
+    from .. import entities
+    from .. import verbs
+
+    server = FakeServer()
+    creator = entities.User(name='creador')
+    world_state = build_world(size, creator).world_state
+    creator.teleport(world_state.starting_room)
+    player = start_session(server, 1, creator)
+    importer = start_session(server, 2, entities.User(name='importador'))  # in the lobby
+    exported_world = json.dumps(verbs.ExportWorld(player).dump_world_state(world_state))
+
+    def import_world(_):
+        for message in ['>', 'importado', exported_world]:
+            importer.process_message(message)
+        importer.jobs.wait()
+
+    def delete_imported_world(_):
+        for imported_world in entities.World.objects(name='importado'):
+            imported_world.delete()
+
+    return {
+        'look': time_case(server, repeats, lambda look: look.show_current_room(), set_up=lambda: verbs.Look(player)),
+        'go': time_case(server, repeats, lambda _: [player.process_message(message) for message in ['ir norte', 'ir sur']]),
+        'take_drop': time_case(server, repeats, lambda _: [player.process_message(message) for message in ['coger cosa 0-0', 'dejar cosa 0-0']]),
+        'verb_chain': time_case(server, repeats, lambda _: player.process_message('cadena0')),
+        'clone': time_case(server, repeats, lambda _: world_state.clone(), tear_down=lambda clone: clone.delete()),
+        'export': time_case(server, repeats, lambda _: (player.process_message('exportar'), player.jobs.wait())),
+        'import': time_case(server, repeats, import_world, tear_down=delete_imported_world),
+    }
+
+
+def run_benchmark(sizes, repeats, label, database):
+    results = {
+        'label': label,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'database': 'mongodb' if database else 'mongomock',
+        'sizes': {},
+    }
+    for size in sizes:
+        print('benchmarking a world of {} rooms...'.format(size), file=sys.stderr)
+        clear_database()
+        results['sizes'][str(size)] = run_cases(size, repeats)
+    clear_database()
+    return results
+
+
+if __name__ == "__main__":
+    sizes = [10, 40, 160]
+    repeats = 5
+    output_file = None
+    label = ''
+    database = None
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 's:r:o:l:d:', ['sizes=', 'repeats=', 'output=', 'label=', 'database='])
+        for opt, arg in opts:
+            if opt in ('-s', '--sizes'):
+                sizes = [int(size) for size in arg.split(',')]
+            elif opt in ('-r', '--repeats'):
+                repeats = int(arg)
+            elif opt in ('-o', '--output'):
+                output_file = arg
+            elif opt in ('-l', '--label'):
+                label = arg
+            elif opt in ('-d', '--database'):
+                database = arg
+    except (getopt.GetoptError, ValueError) as error:
+        print(error)
+        print(__doc__)
+        sys.exit(2)
+
+    connect_to_database(database)
+    results = json.dumps(run_benchmark(sizes, repeats, label, database), indent=4)
+    if output_file is None:
+        print(results)
+    else:
+        with open(output_file, 'w') as file:
+            file.write(results + '\n')
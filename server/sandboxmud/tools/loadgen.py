@@ -0,0 +1,337 @@
+"""
+Load generator: connects many simulated players to a server and measures how fast it answers them.
+
+    python -m sandboxmud.tools.loadgen [-n bots] [-t seconds] [-H host] [-P port] [-i] [-d mongo_db_database_uri]
+
+First a builder bot logs in and creates the test world if it doesn't exist yet: rooms around the starting
+room, takable items and a world custom verb. Then each bot logs in, enters the world from the lobby and
+plays a random mix of actions (look, go, say, take/drop and the custom verb), waiting for the answer to
+each one before sending the next. At the end, the round-trip latency percentiles of each action and the
+number of commands per second are printed.
+
+With -i the server runs in this same process, using the database given with -d or, if none is given,
+an in-memory mongomock database (mongomock must be installed). Otherwise the server must be running
+already, e.g. with python -m sandboxmud.
+
+Options:
+    -n, --bots       number of simulated players (default 20)
+    -t, --time       seconds the test lasts, after all bots have entered the world (default 30)
+    -H, --host       host of the server (default localhost)
+    -P, --port       port of the server (default 1234)
+    -w, --think      mean seconds each bot waits between commands (default 0.5)
+    -r, --rooms      rooms built around the starting room of a new test world (default 8)
+    -m, --mix        weights of the actions, e.g. look=3,go=3,say=2,take=2,verb=1
+    -p, --prefix     prefix of the names of the bots and the test world (default loadgen)
+    -s, --seed       seed for the random choices of the bots
+    -i, --in-process run the server in this process
+    -d, --database   database for the in-process server
+"""
+import asyncio
+import getopt
+import random
+import re
+import sys
+import threading
+import time
+
+DEFAULT_MIX = {'look': 3, 'go': 3, 'say': 2, 'take': 2, 'verb': 1}
+
+# Text that tells us the server has finished answering
+LOBBY_MARKER = 'para importar un mundo.'  # last line of the lobby menu
+ROOM_MARKER = '⮕ Salidas: '  # line with the exits of a room, all the rooms of the test world have some
+CUSTOM_VERB_NAME = 'tocar'
+CUSTOM_VERB_MARKER = 'Tocas la campana'
+
+COMMAND_TIMEOUT = 10  # seconds to wait for an answer before counting the command as failed
+
+
+class CommandTimeout(Exception):
+    """Raised when the server doesn't answer a command in COMMAND_TIMEOUT seconds."""
+
+
+class Bot:
+    """A simulated player connected through telnet."""
+
+    def __init__(self, name, host, port):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.received = ''  # text received since the last answer was found
+        self.exits = []  # exits of the current room, as seen the last time it was looked at
+        self.items_here = []  # takable items of the current room, idem
+        self.items_carried = []
+
+    async def connect(self):
+        deadline = time.monotonic() + COMMAND_TIMEOUT
+        while True:
+            try:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.2)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    async def send(self, message, *markers):
+        """Sends message and, if markers are given, waits until the answer contains one of them.
+        Returns the answer."""
+        self.received = ''
+        self.writer.write((message + '\r\n').encode('utf-8'))
+        await self.writer.drain()
+        if markers:
+            return await self.wait_for(*markers)
+
+    async def wait_for(self, *markers):
+        deadline = time.monotonic() + COMMAND_TIMEOUT
+        while not any(marker in self.received for marker in markers):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise CommandTimeout()
+            try:
+                data = await asyncio.wait_for(self.reader.read(65536), remaining)
+            except asyncio.TimeoutError:
+                raise CommandTimeout()
+            if not data:
+                raise ConnectionError('the server closed the connection of {}'.format(self.name))
+            self.received += data.decode('utf-8', 'replace')
+        answer, self.received = self.received, ''
+        return answer
+
+    async def log_in(self):
+        """Logs in and leaves the bot in the lobby. Returns the lobby menu."""
+        await self.wait_for('¿Cómo te llamas?')
+        answer = await self.send(self.name, LOBBY_MARKER, ROOM_MARKER)
+        if LOBBY_MARKER not in answer:  # the user was in a world last time
+            answer = await self.send('salirmundo', LOBBY_MARKER)
+        return answer
+
+    async def enter_world(self, world_index):
+        self.read_room(await self.send(str(world_index), ROOM_MARKER))
+
+    def read_room(self, answer):
+        """Remembers the exits and takable items of the room shown in answer."""
+        room = answer[answer.rfind('─\n'):]  # the description starts after the underline of the title
+        exits = re.search(ROOM_MARKER + r'(.*)\.', room)
+        self.exits = exits.group(1).split(', ') if exits else []
+        items = re.search('\U0001F441 Ves (.*)\\.', room)
+        self.items_here = items.group(1).split(', ') if items else []
+
+    async def play(self, action, rng):
+        """Does one action and waits for its answer."""
+        if action == 'look':
+            self.read_room(await self.send('mirar', ROOM_MARKER))
+        elif action == 'go':
+            self.read_room(await self.send('ir ' + rng.choice(self.exits), ROOM_MARKER))
+        elif action == 'say':
+            await self.send('decir hola', '{} dice "hola"'.format(self.name))
+        elif action == 'take':
+            if self.items_carried and (not self.items_here or rng.random() < 0.5):
+                item = self.items_carried.pop()
+                answer = await self.send('dejar ' + item, 'Has dejado', 'No hay un objeto', 'Hay más de un objeto')
+                if 'Has dejado' in answer:
+                    self.items_here.append(item)
+            elif self.items_here:
+                item = self.items_here.pop()
+                answer = await self.send('coger ' + item, 'Has cogido', 'No hay un objeto', 'Hay más de un objeto')
+                if 'Has cogido' in answer:
+                    self.items_carried.append(item)
+            else:
+                self.read_room(await self.send('mirar', ROOM_MARKER))
+        elif action == 'verb':
+            await self.send(CUSTOM_VERB_NAME, CUSTOM_VERB_MARKER)
+
+
+def find_world(lobby_menu, world_name):
+    """Returns the number of the world called world_name in the lobby menu, or None."""
+    for line in lobby_menu.splitlines():
+        match = re.match(r'\s*(\d+)\. (.*?)\s+\(\d+\) by ', line)
+        if match and match.group(2) == world_name:
+            return int(match.group(1))
+    return None
+
+
+async def set_up_world(options):
+    """Creates the test world, unless it already exists. Returns its number in the lobby menu."""
+    world_name = options['prefix'] + 'world'
+    builder = Bot(options['prefix'] + 'builder', options['host'], options['port'])
+    await builder.connect()
+    try:
+        await builder.log_in()
+        # the lobby only lists a page of worlds, so it's filtered to the test world, and to the new one if it's created
+        lobby_menu = await builder.send('buscar ' + world_name, LOBBY_MARKER)
+        world_index = find_world(lobby_menu, world_name)
+        if world_index is not None:
+            return world_index
+
+        await builder.send('+', 'Escribe el nombre')
+        world_index = find_world(await builder.send(world_name, LOBBY_MARKER), world_name)
+        await builder.send(str(world_index), 'VIAJANDO A')  # the starting room of a new world has no exits yet
+        for room_number in range(1, options['rooms'] + 1):
+            await builder.send('construir', 'Nombre de la habitación')
+            await builder.send('sala{}'.format(room_number), 'Descripción')
+            await builder.send('Una sala construida para pruebas de carga.', 'Nombre de la salida')
+            await builder.send('', 'Nombre de la salida')
+            await builder.send('', 'Enhorabuena')
+        for item_number in range(1, options['bots'] + 1):
+            await builder.send('fabricar', 'Nombre del objeto')
+            await builder.send('cosa{}'.format(item_number), 'Descripción')
+            await builder.send('Una cosa cualquiera.', 'Visibilidad')
+            await builder.send('c', 'Objeto creado', 'Tendrás que empezar')
+        await builder.send('verbomundo', 'Nombre(s) del verbo')
+        await builder.send(CUSTOM_VERB_NAME, 'Acciones del verbo')
+        await builder.send("textoa '.usuario' {}. Suena muy fuerte.".format(CUSTOM_VERB_MARKER))  # actions get no answer
+        await builder.send('OK', 'creado')
+        await builder.send('salirmundo', LOBBY_MARKER)
+        return world_index
+    finally:
+        builder.close()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class Results:
+    """Latencies and errors of the commands sent by the bots"""
+
+    def __init__(self):
+        self.latencies = {}  # action -> list of seconds
+        self.errors = {}  # action -> number of commands without answer
+
+    def add_latency(self, action, seconds):
+        self.latencies.setdefault(action, []).append(seconds)
+
+    def add_error(self, action):
+        self.errors[action] = self.errors.get(action, 0) + 1
+
+    def report(self, duration):
+        lines = ['{: <8}{: >9}{: >8}{: >10}{: >10}{: >10}'.format('action', 'commands', 'errors', 'p50 ms', 'p95 ms', 'p99 ms')]
+        all_latencies = []
+        for action in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies.get(action, []))
+            all_latencies += latencies
+            lines.append(self._format_row(action, latencies, self.errors.get(action, 0)))
+        lines.append(self._format_row('total', sorted(all_latencies), sum(self.errors.values())))
+        lines.append('{:.1f} commands/s in {:.1f} s'.format(len(all_latencies) / duration, duration))
+        return '\n'.join(lines)
+
+    def _format_row(self, name, latencies, errors):
+        p50, p95, p99 = (percentile(latencies, fraction) * 1000 for fraction in (0.50, 0.95, 0.99))
+        return '{: <8}{: >9}{: >8}{: >10.1f}{: >10.1f}{: >10.1f}'.format(name, len(latencies), errors, p50, p95, p99)
+
+
+async def run_bot(number, world_index, options, results, everyone_in, start_time):
+    rng = random.Random(None if options['seed'] is None else options['seed'] + number)
+    bot = Bot('{}{}'.format(options['prefix'], number), options['host'], options['port'])
+    actions, weights = zip(*options['mix'].items())
+    await bot.connect()
+    try:
+        await bot.log_in()
+        await bot.enter_world(world_index)
+        everyone_in.release()
+        await start_time
+        deadline = time.monotonic() + options['time']
+        while time.monotonic() < deadline:
+            await asyncio.sleep(rng.uniform(0, 2 * options['think']))
+            action = rng.choices(actions, weights)[0]
+            sent = time.monotonic()
+            try:
+                await bot.play(action, rng)
+            except CommandTimeout:
+                results.add_error(action)
+            else:
+                results.add_latency(action, time.monotonic() - sent)
+    finally:
+        bot.close()
+
+
+async def run_load_test(options):
+    print('setting up the test world...')
+    world_index = await set_up_world(options)
+    print('connecting {} bots...'.format(options['bots']))
+    results = Results()
+    everyone_in = asyncio.Semaphore(0)
+    start_time = asyncio.get_running_loop().create_future()
+    bots = [asyncio.create_task(run_bot(number, world_index, options, results, everyone_in, start_time)) for number in range(options['bots'])]
+    for _ in bots:
+        await everyone_in.acquire()
+    print('running for {} seconds...'.format(options['time']))
+    started = time.monotonic()
+    start_time.set_result(None)
+    await asyncio.gather(*bots)
+    print(results.report(time.monotonic() - started))
+
+
+def start_server_in_process(options):
+    """Starts the game loop in a thread of this process. Returns it."""
+    import mongoengine
+    if options['database']:
+        mongoengine.connect(host=options['database'])
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit('The in-process server needs mongomock (pip install mongomock), or a database given with -d.')
+        mongoengine.connect('sandboxmud', host='mongodb://localhost', mongo_client_class=mongomock.MongoClient)
+
+    from .. import async_server, game_loop
+    server = async_server.AsyncTelnetServer(error_policy='ignore', port=options['port'])
+    loop = game_loop.GameLoop(server)
+    threading.Thread(target=asyncio.run, args=(loop.run(),), daemon=True).start()
+    return loop
+
+
+def parse_options(command_line_args):
+    options = {'bots': 20, 'time': 30, 'host': 'localhost', 'port': 1234, 'think': 0.5, 'rooms': 8, 'mix': DEFAULT_MIX,
+               'prefix': 'loadgen', 'seed': None, 'in_process': False, 'database': None}
+    opts, args = getopt.getopt(command_line_args, 'n:t:H:P:w:r:m:p:s:id:',
+                               ['bots=', 'time=', 'host=', 'port=', 'think=', 'rooms=', 'mix=', 'prefix=', 'seed=', 'in-process', 'database='])
+    for opt, arg in opts:
+        if opt in ('-n', '--bots'):
+            options['bots'] = int(arg)
+        elif opt in ('-t', '--time'):
+            options['time'] = float(arg)
+        elif opt in ('-H', '--host'):
+            options['host'] = arg
+        elif opt in ('-P', '--port'):
+            options['port'] = int(arg)
+        elif opt in ('-w', '--think'):
+            options['think'] = float(arg)
+        elif opt in ('-r', '--rooms'):
+            options['rooms'] = int(arg)
+        elif opt in ('-m', '--mix'):
+            options['mix'] = {action: float(weight) for action, weight in (pair.split('=') for pair in arg.split(','))}
+            if not set(options['mix']) <= set(DEFAULT_MIX):
+                raise getopt.GetoptError('unknown action in mix, valid ones are ' + ', '.join(DEFAULT_MIX))
+        elif opt in ('-p', '--prefix'):
+            options['prefix'] = arg
+        elif opt in ('-s', '--seed'):
+            options['seed'] = int(arg)
+        elif opt in ('-i', '--in-process'):
+            options['in_process'] = True
+        elif opt in ('-d', '--database'):
+            options['database'] = arg
+    return options
+
+
+if __name__ == "__main__":
+    try:
+        options = parse_options(sys.argv[1:])
+    except (getopt.GetoptError, ValueError) as error:
+        print(error)
+        print(__doc__)
+        sys.exit(2)
+
+    game_loop = start_server_in_process(options) if options['in_process'] else None
+    asyncio.run(run_load_test(options))
+    if game_loop is not None:
+        print('output: {messages} messages sent in {writes} writes'.format(**game_loop.outbox.get_stats()))
+        print('slow consumers: {dropped_messages} messages dropped, {truncated_messages} truncated, {overflow_disconnections} clients disconnected'.format(**game_loop.server.get_stats()))
@@ -40,4 +40,45 @@ def setup_logger(logger_name, log_file, console=False, level=logging.INFO):
 
     return logger
 
+def reference_id(document, field_name):
+    """Returns the id of the document referenced in a ReferenceField of document, without
+    dereferencing it (which would query the database if it isn't loaded yet)."""
+    value = document._data.get(field_name)
+    return getattr(value, 'id', value)
 
+
+class JsonScanner:
+    """Tells when a JSON object or array sent in several chunks is complete, without parsing it again with
+    each new chunk: feed() only looks at the new text, and only at its brackets, braces, quotes and backslashes."""
+
+    TOKENS = re.compile(r'[{}\[\]"\\]')
+
+    def __init__(self):
+        self._depth = 0
+        self._in_string = False
+        self._escaping = False  # the last chunk ended with a backslash inside a string
+
+    def feed(self, text):
+        """Scans the next chunk of text. Returns True if it closes the outermost object or array."""
+        escaped_position = 0 if self._escaping else -1  # position of the character after a backslash
+        self._escaping = False
+        for match in self.TOKENS.finditer(text):
+            position = match.start()
+            if position == escaped_position:
+                continue
+            character = match.group()
+            if self._in_string:
+                if character == '\\':
+                    escaped_position = position + 1
+                    self._escaping = escaped_position == len(text)
+                elif character == '"':
+                    self._in_string = False
+            elif character == '"':
+                self._in_string = True
+            elif character in '{[':
+                self._depth += 1
+            elif character in '}]' and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    return True
+        return False
@@ -8,6 +8,7 @@ from .remodel import Remodel
 from .say import Say
 from .shout import Shout
 from .verb import Verb
+from .dispatcher import VerbDispatcher
 from .craft import Craft
 from .edit_item import EditItem
 from .connect import Connect
@@ -26,6 +27,6 @@ from .custom_verb import CustomVerb
 from .snapshots import CreateSnapshot, DeploySnapshot, PubishSnapshot, UnpubishSnapshot, DeleteSnapshot
 from .checks import CheckForItem
 from .privileges import ChangeEditFreedom, MakeEditor, RemoveEditor
-from .lobby import EnterWorld, CreateWorld, DeployPublicSnapshot, GoToLobby, DeleteWorld, ImportWorld
+from .lobby import EnterWorld, SearchWorlds, ShowWorldsPage, CreateWorld, DeployPublicSnapshot, GoToLobby, DeleteWorld, ImportWorld
 from .edit_world import EditWorld
 from .export import ExportWorld
\ No newline at end of file
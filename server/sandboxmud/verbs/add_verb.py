@@ -14,11 +14,8 @@ class AddVerb(verb.Verb):
     permissions = verb.PRIVILEGED
 
     @classmethod
-    def can_process(cls, message, session):
-        if message.startswith(cls.item_command) or message.startswith(cls.room_command) or message.startswith(cls.world_command) and super().can_process(message, session):
-            return True
-        else:
-            return False
+    def dispatch_commands(cls):
+        return [cls.item_command, cls.room_command, cls.world_command]
 
     def __init__(self, session):
         super().__init__(session)
@@ -5,6 +5,7 @@ from .. import session
 
 class CustomVerb(Verb):
     command = ''
+    dynamic_matching = True
 
     @classmethod
     def can_process(cls, message, session):
@@ -58,7 +59,7 @@ class CustomVerb(Verb):
             creator_session = self.session if not isinstance(self.session, session.GhostSession) else self.session.creator_session
             ghost = session.GhostSession(self.session.server, self.session.user.room, creator_session, depth=depth)
         except session.GhostSessionMaxDepthExceeded:
-            self.session.send_to_all('En este mundo hay un travieso... menos mal que estoy yo aquí para poner orden :)')
+            self.session.send_to_world('En este mundo hay un travieso... menos mal que estoy yo aquí para poner orden :)')
         else:
             for message in custom_verb.commands:
                 formatted_message = self.format_custom_verb_message(message)
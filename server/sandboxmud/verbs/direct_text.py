@@ -45,7 +45,7 @@ class TextToWorld(verb.Verb):
 
     def process(self, message):
         out_message = message[len(self.command):]
-        self.session.send_to_all(out_message)
+        self.session.send_to_world(out_message)
         self.finish_interaction()
 
 
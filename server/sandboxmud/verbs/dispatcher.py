@@ -0,0 +1,43 @@
+from . import verb
+
+
+class VerbDispatcher:
+    """Finds the verb that has to process a message without polling every verb.
+
+    Verbs are indexed by their dispatch_commands in a prefix trie, with separate tries for lobby
+    verbs and world verbs. Walking a message down the trie yields all verbs whose command is a
+    prefix of the message. The one that comes first in the priority list wins, as long as it
+    doesn't have dynamic_matching. Those verbs (e.g. custom verbs) still decide through can_process.
+    """
+
+    class _Node:
+        __slots__ = ('children', 'verbs')
+
+        def __init__(self):
+            self.children = {}  # next character -> _Node
+            self.verbs = []  # (priority, verb class) of verbs whose command ends at this node
+
+    def __init__(self, verbs):
+        """verbs is the list of verb classes, ordered by priority."""
+        self.tables = {verb.LOBBYVERB: self._Node(), verb.WORLDVERB: self._Node()}
+        for priority, verb_class in enumerate(verbs):
+            for command in verb_class.dispatch_commands():
+                node = self.tables[verb_class.verbtype]
+                for character in command:
+                    node = node.children.setdefault(character, self._Node())
+                node.verbs.append((priority, verb_class))
+
+    def find_verb(self, message, session):
+        """Returns the verb class that must process the message, or None if there isn't any."""
+        node = self.tables[verb.LOBBYVERB if session.user.room is None else verb.WORLDVERB]
+        candidates = list(node.verbs)
+        for character in message:
+            node = node.children.get(character)
+            if node is None:
+                break
+            candidates += node.verbs
+
+        for priority, verb_class in sorted(candidates, key=lambda candidate: candidate[0]):
+            if not verb_class.dynamic_matching or verb_class.can_process(message, session):
+                return verb_class
+        return None
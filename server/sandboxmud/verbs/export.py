@@ -1,108 +1,193 @@
 from . import verb
 from .. import entities
+from .. import jobs
+import itertools
 import json
 import textwrap
+import types
 
 class ExportWorld(verb.Verb):
     command = "exportar"
     pretty_command = "exportar bonito"
     permissions = verb.PRIVILEGED
 
+    BATCH_SIZE = 200  # documents read per query
+    CHUNK_SIZE = 16 * 1024  # characters of JSON per message sent to the client
+    MAX_PENDING_OUTPUT = 4 * CHUNK_SIZE  # bytes the client may have left to read before the next chunk is sent
+    CLIENT_TIMEOUT = 120  # seconds the export waits for the client to read, before giving up
+
     def process(self, message):
         world_state = self.session.user.room.world_state
-        world_state_dict_representation = self.dump_world_state(world_state)
-        if message == self.pretty_command:
-            json_out = json.dumps(
-                world_state_dict_representation, 
-                indent=4,
-                separators=(',', ': ')
-            )
-        else:
-            json_out = json.dumps(world_state_dict_representation)
-        header = textwrap.dedent(f"""
+        pretty = message == self.pretty_command
+        self.session.send_to_client('Exportando el mundo. Mientras tanto no se puede modificar.')
+        self.session.jobs.submit(self.session, lambda send: self.export(world_state, pretty, send), on_done=self.send_footer, locked_world_states=[world_state])
+        self.finish_interaction()
+
+    def export(self, world_state, pretty, send):
+        """Sends the JSON representation of world_state with send, in chunks of about CHUNK_SIZE characters, as it
+        is read. It runs as a job, out of the game loop. Chunks are only cut between tokens, so the JSON is still valid
+        if the client adds line breaks between them. Before each chunk, it waits for the client to read the previous
+        ones, so neither the server cuts the output of a slow client nor the world is read faster than it is sent.
+        Returns False if the client disconnected or stopped reading before the end."""
+        send(textwrap.dedent(f"""
         Tu mundo:
         {chr(9472)*60}
-        """)
+        """))
+        chunk = []
+        chunk_length = 0
+        try:
+            for piece in self.iterencode(self.stream_world_state(world_state), pretty):
+                chunk.append(piece)
+                chunk_length += len(piece)
+                if chunk_length >= self.CHUNK_SIZE:
+                    send.wait_for_client(self.MAX_PENDING_OUTPUT, self.CLIENT_TIMEOUT)
+                    send(''.join(chunk))
+                    chunk = []
+                    chunk_length = 0
+            if chunk:
+                send.wait_for_client(self.MAX_PENDING_OUTPUT, self.CLIENT_TIMEOUT)
+                send(''.join(chunk))
+        except jobs.ClientGone:
+            return False
+        return True
+
+    def send_footer(self, exported):
+        if not exported:
+            self.session.send_to_client(f'\n{chr(9472)*60}\n\nLa exportación se ha interrumpido porque no se estaba leyendo. El texto anterior está incompleto.')
+            return
         footer = textwrap.dedent(f"""
         {chr(9472)*60}
-        
+
         Has exportado el mundo actual. Puedes copiar el texto entre las líneas, y guardarlo donde quieras.
         Para importarlo, sal de este mundo y usa la opción "importar" del menú inicial.
         """)
-        self.session.send_to_client(header + json_out + footer)
-        # json.loads(json_out)
-        self.finish_interaction()
+        self.session.send_to_client(footer)
 
-    def dump_item(self, item):
-        custom_verbs = [self.dump_custom_verb(verb) for verb in item.custom_verbs]
-        return {
-            "item_id": item.item_id,
-            "name": item.name,
-            "description": item.description,
-            "visible": item.visible,
-            "custom_verbs": custom_verbs
-        }
+    def iterencode(self, value, pretty, level=0):
+        """Yields the same JSON json.dumps would return for value, in pieces. Generators are encoded as lists,
+        consuming them as they are encoded, also when they are values of a dict."""
+        indent = '\n' + ' ' * 4 * (level + 1) if pretty else ''
+        closing_indent = '\n' + ' ' * 4 * level if pretty else ''
+        separator = ',' if pretty else ', '
+        if isinstance(value, dict) and any(isinstance(member, types.GeneratorType) for member in value.values()):
+            yield '{'
+            for index, (key, member) in enumerate(value.items()):
+                yield (separator if index > 0 else '') + indent + json.dumps(key) + ': '
+                yield from self.iterencode(member, pretty, level + 1)
+            yield closing_indent + '}'
+        elif isinstance(value, types.GeneratorType):
+            empty = True
+            for element in value:
+                yield ('[' if empty else separator) + indent
+                yield from self.iterencode(element, pretty, level + 1)
+                empty = False
+            yield '[]' if empty else closing_indent + ']'
+        elif pretty:
+            # line breaks in strings are escaped, so all of them are indentation
+            yield json.dumps(value, indent=4, separators=(',', ': ')).replace('\n', closing_indent)
+        else:
+            yield json.dumps(value)
 
-    def dump_custom_verb(self, custom_verb):
-        return {
-            "names":    custom_verb.names,
-            "commands": custom_verb.commands,
-        }
+    def dump_world_state(self, world_state):
+        """Returns the dict representation of world_state, all of it in memory."""
+        return {key: list(value) if isinstance(value, types.GeneratorType) else value
+                for key, value in self.stream_world_state(world_state).items()}
 
-    def dump_exit(self, exit):
-        return {
-            "name": exit.name,
-            "description": exit.description,
-            "destination": exit.destination.alias,
-            "room": exit.room.alias,
-            "visible": exit.visible,
-            "is_open": exit.is_open,
-            "key_names": exit.key_names
-        }
+    def stream_world_state(self, world_state):
+        """Returns the dict representation of world_state, with generators instead of the lists that grow with the world.
+        Documents are read raw, and the aliases of the rooms are taken from a map built with a single query."""
+        world_state_document = entities.WorldState.objects(id=world_state.id).as_pymongo().get()
+        starting_room_id = world_state_document['starting_room']
+        room_aliases = {room['_id']: room['alias'] for room in entities.Room.objects(world_state=world_state.id).only('alias').as_pymongo()}
+        custom_verbs = self.get_custom_verbs([world_state_document])
+
+        # all items in inventories are extracted to be placed at the importer inventory.
+        inventory_item_ids = [item_id for inventory in entities.Inventory.objects(world_state=world_state.id).only('items').as_pymongo()
+                              for item_id in inventory.get('items', [])]
 
-    def dump_room(self, room):
-        custom_verbs = [self.dump_custom_verb(verb) for verb in room.custom_verbs]
-        items = [self.dump_item(item) for item in entities.Item.objects(room=room)]
         return {
-            "name": room.name,
-            "alias": room.alias,
-            "description": room.description,
-            "custom_verbs": custom_verbs,
-            "items": items
+            "next_room_id": world_state_document['_next_room_id'],
+            "starting_room": next(self.dump_rooms(entities.Room.objects(id=starting_room_id))),
+            "other_rooms": self.dump_rooms(entities.Room.objects(world_state=world_state.id, id__ne=starting_room_id)),
+            "custom_verbs": self.dump_custom_verbs(world_state_document, custom_verbs),
+            "exits": (self.dump_exit(exit, room_aliases) for exit in entities.Exit.objects(world_state=world_state.id).as_pymongo()),
+            "inventory": self.dump_items_by_id(inventory_item_ids),
+            "saved_items": self.dump_items(entities.Item.objects(saved_in=world_state.id))
         }
 
-    def dump_inventories(self, inventories):
-        items = []
-        for inventory in inventories:
-            items += inventory.items
-        return [self.dump_item(item) for item in items]
+    def dump_rooms(self, rooms):
+        """Yields the dict representation of the rooms of a queryset, reading their items and custom verbs per batch."""
+        for batch in self.batches(rooms.as_pymongo()):
+            items = list(entities.Item.objects(room__in=[room['_id'] for room in batch]).as_pymongo())
+            items_by_room = {}
+            for item in items:
+                items_by_room.setdefault(item['room'], []).append(item)
+            custom_verbs = self.get_custom_verbs(batch + items)
+            for room in batch:
+                yield self.dump_room(room, items_by_room.get(room['_id'], []), custom_verbs)
 
-    def dump_world_state(self, world_state):
-        starting_room = world_state.starting_room
+    def dump_items(self, items):
+        """Yields the dict representation of the items of a queryset, reading their custom verbs per batch."""
+        for batch in self.batches(items.as_pymongo()):
+            custom_verbs = self.get_custom_verbs(batch)
+            for item in batch:
+                yield self.dump_item(item, custom_verbs)
 
-        other_rooms = entities.Room.objects(world_state=world_state, alias__ne=starting_room.alias)
-        other_rooms = [self.dump_room(room) for room in other_rooms]
+    def dump_items_by_id(self, item_ids):
+        """Yields the dict representation of the items with the given ids, in that order."""
+        for batch_ids in self.batches(item_ids):
+            items = {item['_id']: item for item in entities.Item.objects(id__in=batch_ids).as_pymongo()}
+            custom_verbs = self.get_custom_verbs(list(items.values()))
+            for item_id in batch_ids:
+                if item_id in items:
+                    yield self.dump_item(items[item_id], custom_verbs)
 
-        custom_verbs = [self.dump_custom_verb(verb) for verb in world_state.custom_verbs]
+    def batches(self, iterable):
+        iterator = iter(iterable)
+        while batch := list(itertools.islice(iterator, self.BATCH_SIZE)):
+            yield batch
 
-        exits = []
-        for room in entities.Room.objects(world_state=world_state):
-            exits += room.exits
-        exits = [self.dump_exit(exit) for exit in exits]
- 
-        # all items in inventories are extracted to be placed at the importer inventory.
-        inventories = entities.Inventory.objects(world_state=world_state)
-        inventory = self.dump_inventories(inventories)
+    def get_custom_verbs(self, documents):
+        """Returns a dict with the raw custom verbs of the given raw documents, by id."""
+        custom_verb_ids = [custom_verb_id for document in documents for custom_verb_id in document.get('custom_verbs', [])]
+        if not custom_verb_ids:
+            return {}
+        return {custom_verb['_id']: custom_verb for custom_verb in entities.CustomVerb.objects(id__in=custom_verb_ids).as_pymongo()}
+
+    def dump_custom_verbs(self, document, custom_verbs):
+        return [self.dump_custom_verb(custom_verbs[custom_verb_id]) for custom_verb_id in document.get('custom_verbs', []) if custom_verb_id in custom_verbs]
+
+    def dump_item(self, item, custom_verbs):
+        return {
+            "item_id": item.get('item_id'),
+            "name": item['name'],
+            "description": item['description'],
+            "visible": item['visible'],
+            "custom_verbs": self.dump_custom_verbs(item, custom_verbs)
+        }
+
+    def dump_custom_verb(self, custom_verb):
+        return {
+            "names":    custom_verb.get('names', []),
+            "commands": custom_verb.get('commands', []),
+        }
 
-        saved_items = entities.Item.objects(saved_in=world_state)
-        saved_items = [self.dump_item(item) for item in saved_items]
+    def dump_exit(self, exit, room_aliases):
+        return {
+            "name": exit['name'],
+            "description": exit['description'],
+            "destination": room_aliases.get(exit['destination']),
+            "room": room_aliases.get(exit['room']),
+            "visible": exit['visible'],
+            "is_open": exit['is_open'],
+            "key_names": exit.get('key_names', [])
+        }
 
+    def dump_room(self, room, items, custom_verbs):
         return {
-            "next_room_id": world_state._next_room_id,
-            "starting_room": self.dump_room(starting_room),
-            "other_rooms": other_rooms,
-            "custom_verbs": custom_verbs,
-            "exits": exits,
-            "inventory": inventory,
-            "saved_items": saved_items
-        }
\ No newline at end of file
+            "name": room['name'],
+            "alias": room['alias'],
+            "description": room['description'],
+            "custom_verbs": self.dump_custom_verbs(room, custom_verbs),
+            "items": [self.dump_item(item, custom_verbs) for item in items]
+        }
@@ -10,6 +10,7 @@ class Take(Verb):
     '''
 
     command = 'coger '
+    modifies_world = True
 
     def process(self, message):
         partial_name = message[len(self.command):]
@@ -37,6 +38,7 @@ class Drop(Verb):
     '''
 
     command = 'dejar '
+    modifies_world = True
 
     def process(self, message):
         partial_name = message[len(self.command):]
@@ -76,6 +78,7 @@ class Inventory(Verb):
 
 class Give(Verb):
     command = "dar '"
+    modifies_world = True
 
     def process(self, message):
         message = message[len(self.command):]
@@ -94,6 +97,7 @@ class Give(Verb):
 
 class TakeFrom(Verb):
     command = "quitar '"
+    modifies_world = True
 
     def process(self, message):
         message = message[len(self.command):]
@@ -70,6 +70,7 @@ class AssignKey(verb.Verb):
 
 class Open(verb.Verb):
     command = "abrir "
+    modifies_world = True
 
     def process(self, message):
         command_length = len(self.command)
@@ -1,23 +1,37 @@
 from . import verb
 from .. import entities
+from .. import util
 from . import look
+import bson
 import functools
 import json
 import textwrap
 
 class LobbyMenu(verb.Verb):
     '''Helper class that has the method that shows the lobby menu'''
-    def show_lobby_menu(self):
+    def show_lobby_menu(self, page=0):
+        # the worlds come from the directory, and the users online in them from the session registry
         message = ""
-        if entities.World.objects():
+        worlds = self.session.directory.search(self.session.lobby_search)
+        worlds_in_page, page_count = self.session.directory.get_page(worlds, page)
+        if worlds_in_page:
+            if self.session.lobby_search:
+                message += f'Mundos que contienen "{self.session.lobby_search}" ("buscar" para verlos todos)\n'
             message += f'Introduce el número del mundo al que quieras ir\n'
-            world_names_with_index = ['{}. {: <36}  ({}) by {}'.format(index, world.name, world.get_connected_users(), world.creator.name) for index, world in enumerate(entities.World.objects())]
-            message += functools.reduce(lambda a, b: '{}\n{}'.format(a, b), world_names_with_index)
+            world_names_with_number = ['{}. {: <36}  ({}) by {}'.format(world.number, world.name, self.session.registry.count_sessions_in_world_state(world.world_state_id), world.creator_name) for world in worlds_in_page]
+            message += functools.reduce(lambda a, b: '{}\n{}'.format(a, b), world_names_with_number)
+            if page_count > 1:
+                message += f'\n\nPágina {page + 1} de {page_count}. "pagina <número>" para ver otra.'
+        elif worlds:
+            message += f'Esa página no existe. Hay {page_count} en total.'
+        elif self.session.lobby_search:
+            message += f'No hay ningún mundo que contenga "{self.session.lobby_search}". "buscar" para verlos todos.'
         else:
             message += 'No hay ningún mundo en este servidor.'
         message += '\n\n + para crear un nuevo mundo.'
         message += '\n * para crear tu propia instancia de un mundo público.'
         message += '\n - para borrar uno de tus mundos.'
+        message += '\n buscar <texto> para buscar mundos por su nombre o su creador.'
         message += '\n > para importar un mundo.'
         self.session.send_to_client(message)
 
@@ -33,6 +47,7 @@ class GoToLobby(LobbyMenu):
 class EnterWorld(LobbyMenu):
     command = ''
     verbtype = verb.LOBBYVERB
+    dynamic_matching = True
 
     @classmethod
     def can_process(self, message, session):
@@ -43,17 +58,23 @@ class EnterWorld(LobbyMenu):
 
     def process(self, message):
         try:
-            index = int(message)
+            number = int(message)
         except ValueError:
             self.session.send_to_client("Introduce un número")
             return
         
-        try:
-            chosen_world = entities.World.objects[index]
-        except IndexError:
+        entry = self.session.directory.get_world(number)
+        chosen_world = None if entry is None else entities.World.objects(id=entry.world_id).first()
+        if chosen_world is None:
             self.session.send_to_client("Introduce el número correspondiente a uno de los mundos")
             return
 
+        if self.session.jobs.is_locked(util.reference_id(chosen_world, 'world_state')):
+            # it may be being deleted
+            self.session.send_to_client("Se está copiando, exportando o eliminando ese mundo. Prueba otra vez cuando termine.")
+            self.finish_interaction()
+            return
+
         self.session.user.room = chosen_world.world_state.starting_room
         self.session.user.save()
         
@@ -63,6 +84,31 @@ class EnterWorld(LobbyMenu):
         self.finish_interaction()
 
 
+class SearchWorlds(LobbyMenu):
+    """Lists only the worlds whose name or creator contains a text, until another search. Without a text, lists all of them again."""
+    command = 'buscar'
+    verbtype = verb.LOBBYVERB
+
+    def process(self, message):
+        self.session.lobby_search = message[len(self.command):].strip() or None
+        self.show_lobby_menu()
+        self.finish_interaction()
+
+class ShowWorldsPage(LobbyMenu):
+    command = 'pagina'
+    verbtype = verb.LOBBYVERB
+
+    def process(self, message):
+        try:
+            page = int(message[len(self.command):].strip())
+            if page < 1:
+                raise ValueError
+        except ValueError:
+            self.session.send_to_client('Escribe "pagina" seguido del número de la página que quieres ver.')
+        else:
+            self.show_lobby_menu(page - 1)
+        self.finish_interaction()
+
 class CreateWorld(LobbyMenu):
     verbtype = verb.LOBBYVERB
     command = '+'
@@ -140,14 +186,23 @@ class DeployPublicSnapshot(LobbyMenu):
             return
             
         world_name = message
+        self.session.send_to_client('Desplegando el mundo, te avisaremos cuando esté listo.')
         self.deploy_at_new_world(self.chosen_snapshot, world_name)
-        self.session.send_to_client('Hecho.')
-        self.show_lobby_menu()
         self.finish_interaction()
 
     def deploy_at_new_world(self, snapshot, world_name):
-        snapshot_instance = snapshot.snapshoted_state.clone()
+        self.session.jobs.submit(
+            self.session,
+            lambda progress: snapshot.clone_state(),
+            on_done=lambda snapshot_instance: self.create_deployed_world(snapshot_instance, world_name),
+            locked_world_states=[snapshot._data.get('cow_base')]  # the world it shares documents with, if it's copy-on-write
+        )
+
+    def create_deployed_world(self, snapshot_instance, world_name):
         new_world = entities.World(creator=self.session.user, world_state=snapshot_instance, name=world_name)
+        self.session.send_to_client('Hecho. {} está listo.'.format(world_name))
+        if self.session.user.room is None:  # still in the lobby
+            self.show_lobby_menu()
 
 
 class DeleteWorld(LobbyMenu):
@@ -189,28 +244,63 @@ class DeleteWorld(LobbyMenu):
             self.session.send_to_client("Introduce el número correspondiente a uno de los mundos")
             return
 
+        if self.session.jobs.is_locked(util.reference_id(world_to_delete, 'world_state')):
+            self.session.send_to_client("Se está copiando o exportando ese mundo. Prueba otra vez cuando termine.")
+            return
+
         try:
-            world_to_delete.delete()
+            world_to_delete.ensure_can_be_deleted()
         except entities.CantDelete as e:
             self.session.send_to_client("No se pudo eliminar: {}".format(e))
+            self.show_lobby_menu()
         else:
-            self.session.send_to_client("Hecho.")
-
-        self.show_lobby_menu()
+            world_state_id = util.reference_id(world_to_delete, 'world_state')
+            self.session.send_to_client("Eliminando el mundo. Te avisaremos cuando esté hecho.")
+            self.session.jobs.submit(self.session, lambda progress: world_to_delete.delete(),
+                                     on_done=lambda deleted: self.world_deleted(world_state_id, deleted),
+                                     locked_world_states=[world_state_id])
         self.finish_interaction()
 
+    DELETED_DOCUMENT_NAMES = [
+        (entities.Room, 'salas'),
+        (entities.Item, 'objetos'),
+        (entities.Exit, 'salidas'),
+        (entities.CustomVerb, 'verbos'),
+        (entities.WorldSnapshot, 'snapshots'),
+    ]
+
+    def world_deleted(self, world_state_id, deleted):
+        # the users that were playing in it go back to the lobby. Their rooms were only unset in the database.
+        for session in self.session.registry.get_sessions_in_world_state(world_state_id):
+            session.user.room = None
+            session.user.save()
+            session.current_verb = None  # it may be halfway through a verb of the deleted world
+            session.send_to_client('El mundo en el que estabas ha sido eliminado.')
+            LobbyMenu(session).show_lobby_menu()
+        counts = ['{} {}'.format(deleted.get(document_class._get_collection_name(), 0), name) for document_class, name in self.DELETED_DOCUMENT_NAMES]
+        self.session.send_to_client("Hecho. Se han borrado {} y {}.".format(', '.join(counts[:-1]), counts[-1]))
+        if self.session.user.room is None:  # still in the lobby
+            self.show_lobby_menu()
+
 
 class ImportWorld(LobbyMenu):
     verbtype = verb.LOBBYVERB
     command = '>'
+    bulk_input = True
 
     def process(self, message):
-        self.json_message = ''
-        self.new_world_state = entities.WorldState(save_on_creation=False)
-        self.new_world = entities.World(save_on_creation=False, creator=self.session.user, world_state=self.new_world_state)
+        self.json_chunks = []
+        self.json_scanner = util.JsonScanner()
+        self.prepare_new_world(self.session.user)
         self.session.send_to_client('Escribe el nombre que quieres ponerle al mundo importado. ("/" para cancelar)')
         self.process = self.process_word_name
 
+    def prepare_new_world(self, creator, name=None):
+        """Creates the new world and world state in memory. They are saved by populate_world_from_dict."""
+        # the ids are chosen here, so the documents can reference each other before they are written
+        self.new_world_state = entities.WorldState(id=bson.ObjectId(), save_on_creation=False)
+        self.new_world = entities.World(save_on_creation=False, creator=creator, world_state=self.new_world_state, name=name)
+
     def process_word_name(self, message):
         if message == "/":
             self.session.send_to_client("Creación de mundo cancelada.")
@@ -236,101 +326,94 @@ class ImportWorld(LobbyMenu):
             self.finish_interaction()
             return
         self.session.send_to_client(f"recibido un mensaje de {len(message)} caracteres")
-        message_valid = False
-        self.json_message += message
+        self.json_chunks.append(message)
+        # the text is only parsed once, when its last brace arrives
+        if not self.json_scanner.feed(message):
+            self.session.send_to_client('Mensaje procesado. Esperando el resto de la representación ("/" para cancelar)')
+            return
         try:
-            world_dict = json.loads(self.json_message)
-            self.session.send_to_client('Representación válida, generando mundo.')
-            self.populate_world_from_dict(world_dict)
+            world_dict = json.loads(''.join(self.json_chunks))
+        except json.decoder.JSONDecodeError:
+            self.session.send_to_client('La representación no es válida. Vuelve a pegarla entera ("/" para cancelar)')
+            self.json_chunks = []
+            self.json_scanner = util.JsonScanner()
+            return
+        self.session.send_to_client('Representación válida, generando mundo. Te avisaremos cuando esté listo.')
+        self.session.jobs.submit(self.session, lambda progress: self.import_world(world_dict, progress), on_done=self.world_imported)
+        self.finish_interaction()
+
+    def import_world(self, world_dict, progress):
+        """Returns True if the world was created, or False if some of its names aren't valid."""
+        try:
+            self.populate_world_from_dict(world_dict, progress)
+        except entities.BadItem:
+            return False
+        return True
+
+    def world_imported(self, imported):
+        if imported:
             self.session.send_to_client('Tu nuevo mundo está listo. Si en el mundo exportado había algún objeto en los inventarios de otros jugadores, estos han sido transferidos a tu inventario.')
+        else:
+            self.session.send_to_client('No se ha importado el mundo: tiene objetos o salidas con nombres vacíos, mal formados o repetidos.')
+        if self.session.user.room is None:  # still in the lobby
             self.show_lobby_menu()
-            self.finish_interaction()
-        except json.decoder.JSONDecodeError:
-            self.session.send_to_client('Mensaje procesado, representación inválida. Esperando el resto de la representación ("/" para cancelar)')
         
 
-    def populate_world_from_dict(self, world_dict):
-        items = []
-        custom_verbs = []
-        exits = []
+    def populate_world_from_dict(self, world_dict, progress=None):
+        """Creates the new world from its dict representation. It runs as a job, out of the game loop.
+        All the documents are validated in memory first, and then each collection is written with a
+        single insert. Nobody can enter the world until it is saved at the end."""
+        self.new_world_state.starting_room, items = self.room_from_dict(world_dict['starting_room'])
         other_rooms = []
-        inventories = []
-        saved_items = []
-
-        self.new_world_state.starting_room, added_items = self.room_from_dict(world_dict['starting_room'], add_world_state=False)
-        items += added_items
-
         for room_dict in world_dict['other_rooms']:
             room, added_items = self.room_from_dict(room_dict)
             other_rooms.append(room)
             items += added_items
-        
-        for verb_dict in world_dict['custom_verbs']:
-            custom_verbs.append(self.custom_verb_from_dict(verb_dict))
 
-        all_rooms = other_rooms + [self.new_world_state.starting_room]
+        self.new_world_state.custom_verbs = [self.custom_verb_from_dict(verb_dict) for verb_dict in world_dict['custom_verbs']]
+
+        all_rooms = [self.new_world_state.starting_room] + other_rooms
         rooms_dict_by_alias = { room.alias: room for room in all_rooms }
-        for exit_dict in world_dict['exits']:
-            new_exit = self.exit_from_dict(exit_dict, rooms_dict_by_alias)
-            exits.append(new_exit)
+        exits = [self.exit_from_dict(exit_dict, rooms_dict_by_alias) for exit_dict in world_dict['exits']]
 
-        creator_inventory = self.inventory_from_dict(item_list=world_dict['inventory'], user=self.session.user)
-        inventories.append(creator_inventory)
+        creator_inventory = self.inventory_from_dict(item_list=world_dict['inventory'], user=self.new_world.creator)
+        items += creator_inventory.items
 
-        for item_dict in world_dict['saved_items']:
-            new_item = self.item_from_dict(item_dict, saved_in=self.new_world_state)
-            saved_items.append(new_item)
+        items += [self.item_from_dict(item_dict, saved_in=self.new_world_state) for item_dict in world_dict['saved_items']]
 
         self.new_world_state._next_room_id = world_dict['next_room_id']
 
-        # todo: save all in the correct order
-        # save all entities that world_state references
-        for verb in self.new_world_state.starting_room.custom_verbs:
-            verb.save()
-        self.new_world_state.starting_room.save()
-        for verb in custom_verbs:
-            verb.save()
-        self.new_world_state.custom_verbs = custom_verbs
-        # now the world state can be saved
-        self.new_world_state.save()
-        # now we can add the world_state reference to the starting room
-        self.new_world_state.starting_room.world_state = self.new_world_state
-        self.new_world_state.starting_room.save()
-        # and save the saved items
-        for item in saved_items:
-            for verb in item.custom_verbs:
-                verb.save()
-            item.save()
-        # now we can save the rest of the rooms
-        for room in other_rooms:
-            for verb in room.custom_verbs:
-                verb.save()
-            room.save()
-        # now we can save the exits and items
-        for exit in exits:
-            exit.save()
-        for item in items:
-            for verb in item.custom_verbs:
-                verb.save()
-            item.save()
-        # we finally save the inventories
-        for inventory in inventories:
-            for item in inventory.items:
-                for verb in item.custom_verbs:
-                    verb.save()
-                item.save()
-            inventory.save()
+        # a single validation pass, instead of one per document as they are saved
+        entities.Item.ensure_names_are_valid(items, exits)
+        custom_verbs = [verb for document in [self.new_world_state] + all_rooms + items for verb in document.custom_verbs]
+        # in order: each collection is written after the ones it references, and the world state last
+        documents = [
+            (entities.CustomVerb, custom_verbs),
+            (entities.Room, all_rooms),
+            (entities.Item, items),
+            (entities.Exit, exits),
+            (entities.Inventory, [creator_inventory]),
+            (entities.WorldState, [self.new_world_state]),
+        ]
+        for _, documents_of_class in documents:
+            for document in documents_of_class:
+                document.validate()
+
+        if progress is not None:
+            progress('Guardando {} salas...'.format(len(all_rooms)))
+        for document_class, documents_of_class in documents:
+            if documents_of_class:
+                document_class._get_collection().insert_many([document.to_mongo() for document in documents_of_class])
         # and the world itself
         self.new_world.save()
-        
 
-
-    def room_from_dict(self, room_dict, add_world_state=True):
+    def room_from_dict(self, room_dict):
         custom_verbs = [self.custom_verb_from_dict(verb_dict) for verb_dict in room_dict['custom_verbs']]
 
         new_room = entities.Room(
+            id=bson.ObjectId(),
             save_on_creation=False, 
-            world_state=self.new_world_state if add_world_state else None,
+            world_state=self.new_world_state,
             name=room_dict['name'],
             alias=room_dict['alias'],
             description=room_dict['description'],
@@ -347,6 +430,7 @@ class ImportWorld(LobbyMenu):
         custom_verbs = [self.custom_verb_from_dict(verb_dict) for verb_dict in item_dict['custom_verbs']]
         
         new_item = entities.Item(
+            id=bson.ObjectId(),
             save_on_creation=False,
             item_id=item_dict['item_id'],
             name=item_dict['name'],
@@ -354,13 +438,15 @@ class ImportWorld(LobbyMenu):
             visible=item_dict['visible'],
             custom_verbs=custom_verbs,
             room=room,
-            saved_in=saved_in
+            saved_in=saved_in,
+            world_state=self.new_world_state if saved_in is None else None  # saved items aren't in the world
         )
 
         return new_item
 
     def custom_verb_from_dict(self, verb_dict):
         custom_verb = entities.CustomVerb(
+            id=bson.ObjectId(),
             save_on_creation=False, 
             names=verb_dict["names"],
             commands=verb_dict["commands"]
@@ -374,11 +460,13 @@ class ImportWorld(LobbyMenu):
         destination = rooms_dict_by_alias[destination_alias]
         
         new_exit=entities.Exit(
+            id=bson.ObjectId(),
             save_on_creation=False,
             name=exit_dict["name"],
             description=exit_dict["description"],
             destination=destination,
             room=room,
+            world_state=self.new_world_state,
             visible=exit_dict['visible'],
             is_open=exit_dict['is_open'],
             key_names=exit_dict['key_names'],
@@ -393,6 +481,7 @@ class ImportWorld(LobbyMenu):
             items.append(new_item)
         
         new_inventory = entities.Inventory(
+            id=bson.ObjectId(),
             save_on_creation=False,
             user=user,
             world_state=self.new_world_state,
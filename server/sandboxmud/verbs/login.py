@@ -23,13 +23,11 @@ class Login(Verb):
 
     def process_user_name(self, name):
         if entities.User.objects(name=name):
-            self.session.user = entities.User.objects(name=name).first()
-            self.session.user.connect(self.session.client_id)
+            self.session.log_in(entities.User.objects(name=name).first())
             self.session.send_to_client("Bienvenido de nuevo {}.".format(name))
         else:
             starting_room = None
-            self.session.user = entities.User(name=name, room=starting_room)
-            self.session.user.connect(self.session.client_id)
+            self.session.log_in(entities.User(name=name, room=starting_room))
             self.session.send_to_client('Bienvenido {}.'.format(name))
 
         self.session.user.leave_master_mode()
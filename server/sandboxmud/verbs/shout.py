@@ -8,5 +8,5 @@ class Shout(Verb):
     def process(self, message):
         command_length = len(self.command)
         out_message = f'{self.session.user.name} grita "¡¡{message[command_length:].upper()}!!"'
-        self.session.send_to_all(out_message)
+        self.session.send_to_world(out_message)
         self.finish_interaction()
\ No newline at end of file
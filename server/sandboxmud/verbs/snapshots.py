@@ -36,15 +36,11 @@ class CreateSnapshot(verb.Verb):
         world = self.session.user.room.world_state.get_world()
 
         self.snapshot.name = message
-        self.snapshot.snapshoted_state = self.snapshot_world_state()
+        self.snapshot.cow_base = self.session.user.room.world_state  # shares its documents until they change
         self.snapshot.save()
         world.add_snapshot(self.snapshot)
         self.session.send_to_client('Snapshot creado.')
         self.finish_interaction()
-    
-    def snapshot_world_state(self):
-        new_world_state = self.session.user.room.world_state.clone()
-        return new_world_state
 
 
 class DeploySnapshot(verb.Verb):
@@ -92,8 +88,8 @@ class DeploySnapshot(verb.Verb):
 
         if chosen_snapshot is not None:
             world = self.session.user.room.world_state.get_world()
+            self.session.send_to_client('Desplegando {}, te avisaremos cuando esté listo. Mientras tanto no se puede modificar el mundo.'.format(chosen_snapshot.name))
             self.deploy_snapshot(chosen_snapshot, world)
-            self.session.send_to_client('{} desplegado. Puedes recuperar el mundo tal y como era antes del despliegue. Para hacerlo, despliega el snapshot "{}".'.format(chosen_snapshot.name, _backup_snapshot_name))
             self.finish_interaction()
 
     def show_world_snapshot_list(self):
@@ -114,8 +110,17 @@ class DeploySnapshot(verb.Verb):
         self.session.send_to_client(message)
 
     def deploy_snapshot(self, chosen_snapshot, world):
-        new_world_state = chosen_snapshot.snapshoted_state.clone()
-
+        """The snapshot is copied by a job. The world state it shares documents with, if it's copy-on-write,
+        is locked too, so the copy is consistent."""
+        self.session.jobs.submit(
+            self.session,
+            lambda progress: chosen_snapshot.clone_state(),
+            on_done=lambda new_world_state: self.replace_world_state(chosen_snapshot, world, new_world_state),
+            locked_world_states=[world.world_state, chosen_snapshot._data.get('cow_base')]
+        )
+
+    def replace_world_state(self, chosen_snapshot, world, new_world_state):
+        world.reload()
         # user evacuation!!
         for old_room in world.world_state.get_rooms():
             for user in old_room.users:
@@ -129,6 +134,7 @@ class DeploySnapshot(verb.Verb):
         self.save_as_backup(world.world_state, world)
         world.world_state = new_world_state
         world.save()
+        self.session.send_to_client('{} desplegado. Puedes recuperar el mundo tal y como era antes del despliegue. Para hacerlo, despliega el snapshot "{}".'.format(chosen_snapshot.name, _backup_snapshot_name))
 
     def save_as_backup(self, world_state, world):
         backup_snapshot = next(filter(lambda s: s.name==_backup_snapshot_name, world.snapshots), None)
@@ -140,7 +146,8 @@ class DeploySnapshot(verb.Verb):
             old_backup = backup_snapshot.snapshoted_state
             backup_snapshot.snapshoted_state = world_state
             backup_snapshot.save()
-            old_backup.delete()
+            # its copy-on-write snapshots, if any, are copied before it is deleted, so it is locked meanwhile
+            self.session.jobs.submit(self.session, lambda progress: old_backup.delete(), locked_world_states=[old_backup])
 
 
 class PubishSnapshot(verb.Verb):
@@ -298,6 +305,12 @@ class DeleteSnapshot(verb.Verb):
             self.session.send_to_client("Introduce el número correspondiente a uno de los snapshots")
             return
 
-        chosen_snapshot.delete()
-        self.session.send_to_client('Hecho, el snapshot ha sido borrado!')
+        # the world is locked too: a copy-on-write snapshot shares its documents until it is deleted
+        locked_world_states = [self.session.user.room.world_state, chosen_snapshot._data.get('snapshoted_state'), chosen_snapshot._data.get('cow_base')]
+        self.session.send_to_client('Borrando el snapshot. Mientras tanto no se puede modificar el mundo.')
+        self.session.jobs.submit(self.session, lambda progress: chosen_snapshot.delete(), on_done=self.snapshot_deleted,
+                                 locked_world_states=locked_world_states)
         self.finish_interaction()
+
+    def snapshot_deleted(self, _):
+        self.session.send_to_client('Hecho, el snapshot ha sido borrado!')
@@ -1,4 +1,5 @@
 from .. import session
+from .. import util
 
 FREE = 'free'
 PRIVILEGED = 'privileged'
@@ -15,8 +16,9 @@ class Verb():
     a fixed set of user messages, and takes all the actions relative to them.
 
     Each verb has its own criteria that determines if it can process a given message. This
-    criteria is defined in its can_process(message) method. The session calls the can_process method
-    of each verb in its verb list until it finds a verb that can process the message. 
+    criteria is defined in its can_process(message) method. Most verbs just check that the message
+    starts with one of their dispatch_commands, so the session's VerbDispatcher finds them by those
+    commands alone. Verbs with dynamic_matching are asked through can_process instead.
 
     Then, the session creates a new instance of the verb and lets it process all user messages
     (via the process(message) method) until the verb instance returns True for its method command_finished.
@@ -25,6 +27,15 @@ class Verb():
     command = 'verb '
     permissions = FREE  # possible values: FREE, PRIVILEGED and CREATOR.
     verbtype = WORLDVERB
+    dynamic_matching = False  # True if the commands of the verb aren't enough to know if it can process a message.
+    bulk_input = False  # True if the verb receives long inputs in many messages, so they aren't rate limited.
+    modifies_world = False  # True if the verb changes the world even if everybody can use it. Verbs that aren't FREE always can.
+
+    @classmethod
+    def dispatch_commands(cls):
+        """Commands under which the VerbDispatcher indexes this verb. Messages that don't start
+        with any of them are never processed by the verb."""
+        return [cls.command]
 
     @classmethod
     def can_process(cls, message, session):
@@ -34,8 +45,9 @@ class Verb():
         if cls.verbtype == LOBBYVERB and session.user.room is not None:
             return False
 
-        if message.startswith(cls.command):
-            return True
+        for command in cls.dispatch_commands():
+            if message.startswith(command):
+                return True
         
         return False
 
@@ -44,11 +56,22 @@ class Verb():
         self.finished = False
 
     def execute(self, message):
-        if self.user_has_enough_privileges():
-            self.process(message)
-        else:
+        if not self.user_has_enough_privileges():
             self.session.send_to_client('No tienes permisos suficientes para hacer eso.')
             self.finish_interaction()
+        elif self.world_is_locked():
+            self.session.send_to_client('Se está copiando o exportando este mundo. Prueba otra vez cuando termine.')
+            self.finish_interaction()
+        else:
+            self.process(message)
+
+    def world_is_locked(self):
+        """True if the verb could change the world of the user while a job is working on it."""
+        if self.session.user is None or self.session.user.room is None:
+            return False
+        if self.permissions == FREE and not self.modifies_world:
+            return False
+        return self.session.jobs.is_locked(util.reference_id(self.session.user.room, 'world_state'))
 
     def user_has_enough_privileges(self):
         if self.session.user is None: